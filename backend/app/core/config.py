@@ -23,6 +23,8 @@ class Settings(BaseSettings):
     QDRANT_PORT: int = 6333
     QDRANT_API_KEY: Optional[str] = None
     QDRANT_USE_HTTPS: bool = False
+    QDRANT_PREFER_GRPC: bool = False  # gRPC for scroll/upsert (needs the gRPC port reachable)
+    QDRANT_GRPC_PORT: int = 6334
     QDRANT_COLLECTION_USERS: str = "users"
     QDRANT_VECTOR_SIZE: int = 128
 
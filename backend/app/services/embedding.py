@@ -7,6 +7,7 @@ from pathlib import Path
 import logging
 from datetime import datetime
 from collections import Counter, OrderedDict
+from functools import lru_cache
 from app.models.schemas import UserProfile
 import threading
 import time
@@ -84,6 +85,31 @@ class LRUCache:
         }
 
 
+@lru_cache(maxsize=4096)
+def _name_similarity(query: str, name: str) -> float:
+    """Score how closely a normalized name matches a normalized query
+
+    Cached per (query, name) pair rather than per result list so memory stays
+    bounded while recurring artists skip the substring/word-overlap scoring.
+    Returns 0.0 when the pair is not a candidate match.
+    """
+    if query in name:
+        # Exact substring match - high score
+        return 0.8 + (len(query) / len(name)) * 0.2
+    if name in query:
+        return 0.7
+    # Word-level matching (more expensive)
+    query_words = set(query.split())
+    name_words = set(name.split())
+    if query_words and name_words:
+        overlap = len(query_words & name_words)
+        if overlap > 0:
+            score = overlap / max(len(query_words), len(name_words))
+            if score > 0.3:  # Threshold
+                return score
+    return 0.0
+
+
 class EmbeddingService:
     """Service for generating user embeddings from GNN model (OPTIMIZED)
 
@@ -438,32 +464,17 @@ class EmbeddingService:
 
         # Find partial string matches with early exit
         candidates = []
-        query_words = set(query.split())
         max_checks = min(len(id_to_name), 5000)  # Limit search scope
 
         for idx in range(max_checks):
             name = id_to_name[idx]
 
-            # Quick substring check first (faster than word comparison)
-            if query in name:
-                # Exact substring match - high score
-                score = 0.8 + (len(query) / len(name)) * 0.2
+            score = _name_similarity(query, name)
+            if score:
                 candidates.append((idx, score, name))
                 # If we have a very good match, can exit early
                 if score > 0.95 and len(candidates) >= 3:
                     break
-            elif name in query:
-                score = 0.7
-                candidates.append((idx, score, name))
-            else:
-                # Word-level matching (more expensive)
-                name_words = set(name.split())
-                if query_words and name_words:
-                    overlap = len(query_words & name_words)
-                    if overlap > 0:
-                        score = overlap / max(len(query_words), len(name_words))
-                        if score > 0.3:  # Threshold
-                            candidates.append((idx, score, name))
 
             # Early exit if we have enough good candidates
             if len(candidates) >= 10:
@@ -524,7 +535,6 @@ class EmbeddingService:
 
         # Find partial matches (optimized with early exit)
         candidates = []
-        normalized_words = set(normalized_name.split())
 
         # Use id_to_name list if available (for FAISS mode), otherwise dict keys
         if id_to_name:
@@ -541,9 +551,8 @@ class EmbeddingService:
         for idx in range(max_checks):
             key = search_list[idx]
 
-            # Quick substring check first
-            if normalized_name in key:
-                score = 0.8 + (len(normalized_name) / len(key)) * 0.2
+            score = _name_similarity(normalized_name, key)
+            if score:
                 # Get embedding from dict or FAISS
                 if embeddings_dict and key in embeddings_dict:
                     emb = embeddings_dict[key]
@@ -554,30 +563,6 @@ class EmbeddingService:
                 candidates.append((emb, score))
                 if score > 0.95 and len(candidates) >= 5:
                     break
-            elif key in normalized_name:
-                score = 0.7
-                if embeddings_dict and key in embeddings_dict:
-                    emb = embeddings_dict[key]
-                elif faiss_index is not None:
-                    emb = faiss_index.reconstruct(idx)
-                else:
-                    continue
-                candidates.append((emb, score))
-            else:
-                # Word-level matching
-                key_words = set(key.split())
-                if normalized_words and key_words:
-                    overlap = len(normalized_words & key_words)
-                    if overlap > 0:
-                        score = overlap / max(len(normalized_words), len(key_words))
-                        if score > 0.3:  # Threshold for similarity
-                            if embeddings_dict and key in embeddings_dict:
-                                emb = embeddings_dict[key]
-                            elif faiss_index is not None:
-                                emb = faiss_index.reconstruct(idx)
-                            else:
-                                continue
-                            candidates.append((emb, score))
 
             # Early exit if we have enough good candidates
             if len(candidates) >= 10:
@@ -606,6 +591,23 @@ class EmbeddingService:
         self.fuzzy_cache[cache_key] = "__NOT_FOUND__"
         return None
 
+    def similarity_cache_stats(self) -> Dict:
+        """Get pairwise name-similarity cache statistics"""
+        info = _name_similarity.cache_info()
+        total = info.hits + info.misses
+        hit_rate = (info.hits / total * 100) if total > 0 else 0
+        return {
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": f"{hit_rate:.1f}%"
+        }
+
+    def clear_similarity_cache(self):
+        """Drop cached pairwise name-similarity scores (e.g. under memory pressure)"""
+        _name_similarity.cache_clear()
+
     def calculate_temporal_decay(self, timestamp: int, current_time: int, half_life_days: float = 30.0) -> float:
         """
         Calculate exponential temporal decay weight
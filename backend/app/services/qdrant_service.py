@@ -16,13 +16,17 @@ class QdrantService:
             self.client = QdrantClient(
                 url=f"https://{settings.QDRANT_HOST}:{settings.QDRANT_PORT}",
                 api_key=settings.QDRANT_API_KEY,
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC,
             )
         else:
             # Local Qdrant configuration
             self.client = QdrantClient(
                 host=settings.QDRANT_HOST,
                 port=settings.QDRANT_PORT,
-                https=settings.QDRANT_USE_HTTPS
+                https=settings.QDRANT_USE_HTTPS,
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC
             )
         self.collection_name = settings.QDRANT_COLLECTION_USERS
         self.vector_size = settings.QDRANT_VECTOR_SIZE
@@ -107,21 +111,16 @@ class QdrantService:
                 user_id = str(uuid.uuid4())
                 print(f"Creating new user: {username} (ID: {user_id})")
 
-            payload = {
-                "username": username,
-                "is_real": is_real,
-                "top_artists": top_artists[:30],  # Store top 30 for better shared artists matching
-                "country": country,
-                "profile_image": profile_image,
-                "top_genres": top_genres or [],
-                "created_at": existing_user["created_at"] if existing_user and "created_at" in existing_user else datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
-
-            point = PointStruct(
-                id=user_id,
-                vector=embedding,
-                payload=payload
+            point = self.build_user_point(
+                user_id=user_id,
+                username=username,
+                embedding=embedding,
+                top_artists=top_artists,
+                is_real=is_real,
+                country=country,
+                profile_image=profile_image,
+                top_genres=top_genres,
+                created_at=existing_user.get("created_at") if existing_user else None
             )
 
             self.client.upsert(
@@ -134,6 +133,50 @@ class QdrantService:
         except Exception as e:
             raise Exception(f"Failed to add user embedding: {str(e)}")
 
+    def build_user_point(
+        self,
+        user_id: str,
+        username: str,
+        embedding: List[float],
+        top_artists: List[str],
+        is_real: bool = True,
+        country: Optional[str] = None,
+        profile_image: Optional[str] = None,
+        top_genres: Optional[List[str]] = None,
+        created_at: Optional[str] = None
+    ) -> PointStruct:
+        """Build a user point with the standard payload (for single or batched upserts)"""
+        now = datetime.utcnow().isoformat()
+        payload = {
+            "username": username.lower().strip(),
+            "is_real": is_real,
+            "top_artists": top_artists[:30],  # Store top 30 for better shared artists matching
+            "country": country,
+            "profile_image": profile_image,
+            "top_genres": top_genres or [],
+            "created_at": created_at or now,
+            "updated_at": now
+        }
+
+        return PointStruct(
+            id=user_id,
+            vector=embedding,
+            payload=payload
+        )
+
+    def upsert_user_points(self, points: List[PointStruct], wait: bool = True):
+        """Upsert many user points in a single request"""
+        if not points:
+            return
+        try:
+            self.client.upsert(
+                collection_name=self.collection_name,
+                points=points,
+                wait=wait
+            )
+        except Exception as e:
+            raise Exception(f"Failed to upsert user embeddings: {str(e)}")
+
     def find_similar_users(
         self,
         embedding: List[float],
@@ -172,8 +215,8 @@ class QdrantService:
         except Exception as e:
             raise Exception(f"Failed to find similar users: {str(e)}")
 
-    def get_user_by_username(self, username: str) -> Optional[Dict]:
-        """Get user by username (case-insensitive)"""
+    def get_user_by_username(self, username: str, with_vectors: bool = True) -> Optional[Dict]:
+        """Get user by username (case-insensitive); uses the username payload index"""
         try:
             # IMPORTANT: Last.fm usernames are case-insensitive, normalize to lowercase
             username = username.lower().strip()
@@ -190,7 +233,7 @@ class QdrantService:
                 ),
                 limit=1,
                 with_payload=True,
-                with_vectors=True
+                with_vectors=with_vectors
             )
 
             if search_result[0]:
@@ -213,11 +256,11 @@ class QdrantService:
             print(f"Error getting user by username: {str(e)}")
             return None
 
-    def count_users(self, is_real: Optional[bool] = None) -> int:
-        """Count users in database"""
+    def count_users(self, is_real: Optional[bool] = None, exact: bool = True) -> int:
+        """Count users in database (exact=False allows a faster approximate count)"""
         try:
             if is_real is None:
-                result = self.client.count(collection_name=self.collection_name)
+                result = self.client.count(collection_name=self.collection_name, exact=exact)
                 return result.count
             else:
                 result = self.client.count(
@@ -229,7 +272,8 @@ class QdrantService:
                                 match=MatchValue(value=is_real)
                             )
                         ]
-                    )
+                    ),
+                    exact=exact
                 )
                 return result.count
         except Exception as e:
@@ -1,6 +1,7 @@
 import asyncio
 import random
-from typing import List
+import uuid
+from typing import List, Optional
 from app.services.lastfm import lastfm_service
 from app.services.embedding import embedding_service
 from app.services.qdrant_service import qdrant_service
@@ -17,7 +18,13 @@ class GhostUserSeeder:
     - Listening history length
     """
 
+    DEFAULT_BATCH_SIZE = 128  # Points per Qdrant upsert; small batches avoid long write blocks
+
     def __init__(self):
+        self.batch_size = self.DEFAULT_BATCH_SIZE
+        self._pending = []  # Ghost user points waiting for the next upsert
+        self._failed = 0
+
         # Curated list of diverse Last.fm users for seeding
         # In production, this could be fetched from a database or API
         self.curated_users = {
@@ -46,17 +53,20 @@ class GhostUserSeeder:
             }
         }
 
-    async def seed_ghost_users(self, count: int = 10000) -> int:
+    async def seed_ghost_users(self, count: int = 10000, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
         """
         Seed ghost users into Qdrant
 
         Args:
             count: Target number of ghost users to create
+            batch_size: Number of users written per Qdrant upsert
 
         Returns:
             Number of users actually created
         """
         users_created = 0
+        self.batch_size = batch_size
+        self._failed = 0
 
         # Calculate distribution
         distributions = {
@@ -98,9 +108,51 @@ class GhostUserSeeder:
             category="international"
         )
 
+        # Wait on the last batch so the users are applied before we report
+        self._flush(wait=True)
+        users_created -= self._failed
+
         print(f"Ghost seeding complete! Created {users_created} users")
         return users_created
 
+    def _queue_user(
+        self,
+        username: str,
+        embedding: List[float],
+        top_artists: List[str],
+        country: Optional[str] = None,
+        profile_image: Optional[str] = None,
+        top_genres: Optional[List[str]] = None
+    ):
+        """Queue a ghost user point, reusing the ID if the username already exists"""
+        # Flush a full batch before queueing, so the final flush is never empty
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+        username = username.lower().strip()
+        existing_user = qdrant_service.get_user_by_username(username, with_vectors=False)
+
+        self._pending.append(qdrant_service.build_user_point(
+            user_id=existing_user["user_id"] if existing_user else str(uuid.uuid4()),
+            username=username,
+            embedding=embedding,
+            top_artists=top_artists,
+            is_real=False,
+            country=country,
+            profile_image=profile_image,
+            top_genres=top_genres,
+            created_at=existing_user.get("created_at") if existing_user else None
+        ))
+
+    def _flush(self, wait: bool = False):
+        """Upsert the queued ghost users in one bounded batch"""
+        points, self._pending = self._pending, []
+        try:
+            qdrant_service.upsert_user_points(points, wait=wait)
+        except Exception as e:
+            print(f"Failed to upsert {len(points)} ghost users: {str(e)}")
+            self._failed += len(points)
+
     async def _seed_category(
         self,
         usernames: List[str],
@@ -132,12 +184,11 @@ class GhostUserSeeder:
                     [a.name for a in profile.top_artists[:20]]
                 )
 
-                # Store in Qdrant as ghost user
-                qdrant_service.add_user_embedding(
+                # Queue for Qdrant as ghost user
+                self._queue_user(
                     username=f"ghost_{username}",
                     embedding=embedding.tolist(),
                     top_artists=[a.name for a in profile.top_artists[:10]],
-                    is_real=False,
                     country=profile.country,
                     profile_image=profile.image,
                     top_genres=top_genres
@@ -199,13 +250,10 @@ class GhostUserSeeder:
                     synthetic_embedding = synthetic_embedding / np.linalg.norm(synthetic_embedding)
 
                     # Create synthetic user
-                    qdrant_service.add_user_embedding(
+                    self._queue_user(
                         username=f"synthetic_{category}_{i}",
                         embedding=synthetic_embedding.tolist(),
                         top_artists=selected_artists,
-                        is_real=False,
-                        country=None,
-                        profile_image=None,
                         top_genres=[category]
                     )
 
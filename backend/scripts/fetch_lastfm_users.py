@@ -48,6 +48,21 @@ LASTFM_API_KEY = os.getenv("LASTFM_API_KEY")
 BASE_URL = "http://ws.audioscrobbler.com/2.0/"
 
 
+def _model_to_dict(obj):
+    """JSON fallback for pydantic models embedded in profile data"""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _profile_to_ndjson(profile_data: dict) -> bytes:
+    """Serialize one fetched profile as a {username: profile} NDJSON line"""
+    line = orjson.dumps({profile_data["username"]: profile_data}, default=_model_to_dict)
+    if isinstance(line, str):  # stdlib json fallback returns str
+        line = line.encode("utf-8")
+    return line + b"\n"
+
+
 class PerformanceMonitor:
     """Track performance metrics for optimization"""
     def __init__(self):
@@ -262,7 +277,7 @@ class LastFmUserCrawler:
     def __init__(self, api_key: str, max_concurrent: int = 5):
         self.api_key = api_key
         self.visited_users = set()
-        self.user_profiles = {}
+        self.profiles_file = None  # Append-mode NDJSON sink for seeded profiles
         self.session = None
         self.max_concurrent = max_concurrent
         
@@ -310,7 +325,8 @@ class LastFmUserCrawler:
         # Memory management
         self.embedding_timeout = 30  # seconds
         self.memory_threshold_mb = 2000  # 2GB
-        self.gc_interval = 50  # Garbage collect every N users
+        self.gc_interval = 50  # Young-generation collect every N users
+        self._proc = None  # Cached psutil.Process handle (set in __aenter__)
         
     async def __aenter__(self):
         # Optimized TCP connector: persistent connections, DNS caching
@@ -322,6 +338,9 @@ class LastFmUserCrawler:
         )
         self.session = aiohttp.ClientSession(connector=connector)
         
+        if PSUTIL_AVAILABLE:
+            self._proc = psutil.Process()
+        
         # Import services
         from app.services.embedding import EmbeddingService
         from app.services.qdrant_service import qdrant_service
@@ -364,8 +383,8 @@ class LastFmUserCrawler:
                                 continue
                             if resp.status != 200:
                                 return {}
-                            content = await resp.read()
-                            return orjson.loads(content) if isinstance(orjson, type(json)) else json.loads(content)
+                            # orjson (or stdlib json fallback) parses the raw bytes
+                            return orjson.loads(await resp.read())
                 else:
                     async with self.session.get(
                         BASE_URL, params=params, timeout=10
@@ -375,7 +394,7 @@ class LastFmUserCrawler:
                             continue
                         if resp.status != 200:
                             return {}
-                        return await resp.json()
+                        return orjson.loads(await resp.read())
                         
             except asyncio.TimeoutError:
                 await asyncio.sleep(1)
@@ -797,11 +816,12 @@ class LastFmUserCrawler:
             
             try:
                 # Check memory every 10 users
-                if PSUTIL_AVAILABLE and processed_count % 10 == 0:
-                    memory_mb = psutil.Process().memory_info().rss / 1024 / 1024
+                if self._proc is not None and processed_count % 10 == 0:
+                    memory_mb = self._proc.memory_info().rss >> 20
                     
                     if memory_mb > self.memory_threshold_mb:
-                        # Force garbage collection and pause
+                        # Drop cached similarity scores, force garbage collection and pause
+                        self.embedding_service.clear_similarity_cache()
                         gc.collect()
                         
                         # Clear GPU memory if available
@@ -818,12 +838,17 @@ class LastFmUserCrawler:
                 
                 if await self.seed_user_directly(profile_data):
                     self.stats["processed"] += 1
+                    if self.profiles_file is not None:
+                        await asyncio.to_thread(
+                            self.profiles_file.write, _profile_to_ndjson(profile_data)
+                        )
                     pbar_process.update(1)
                     processed_count += 1
                     
-                    # Periodic garbage collection
+                    # Periodic young-generation collection; full sweeps only
+                    # run above when memory_threshold_mb is exceeded
                     if processed_count % self.gc_interval == 0:
-                        gc.collect()
+                        gc.collect(generation=1)
                         
             except Exception as e:
                 self.stats["failed"] += 1
@@ -831,10 +856,12 @@ class LastFmUserCrawler:
                 self.process_queue.task_done()
     
     async def crawl_bfs_optimized(self, seed_user: str, max_users: int = 500,
-                                  num_fetchers: int = 2, num_processors: int = None):
+                                  num_fetchers: int = 2, num_processors: int = None,
+                                  profiles_path: Path = None):
         """
         Run producer-consumer pipeline with monitoring
         OPTIMIZED: Periodic status logging and memory monitoring
+        Seeded profiles are appended to profiles_path (NDJSON) as they complete
         """
         # Auto-scale processors
         if num_processors is None:
@@ -843,6 +870,9 @@ class LastFmUserCrawler:
         # Initialize timeout stats
         self.stats["timeouts"] = 0
         
+        if profiles_path is not None:
+            self.profiles_file = open(profiles_path, "ab")
+        
         # Monitor task for periodic logging
         async def monitor_task():
             """Log system status every 30 seconds"""
@@ -850,24 +880,31 @@ class LastFmUserCrawler:
                 try:
                     await asyncio.sleep(30)
                     
-                    if PSUTIL_AVAILABLE:
-                        memory_mb = psutil.Process().memory_info().rss / 1024 / 1024
-                    else:
-                        memory_mb = 0
+                    memory_mb = self._proc.memory_info().rss >> 20 if self._proc is not None else 0
                     
                     cache_stats = self.embedding_service.fuzzy_cache.stats() if hasattr(self.embedding_service.fuzzy_cache, 'stats') else {}
+                    sim_stats = self.embedding_service.similarity_cache_stats()
                     
-                    print(f"\n📊 Status: processed={self.stats['processed']}, "
-                          f"memory={memory_mb:.0f}MB, "
-                          f"fetch_q={self.fetch_queue.qsize()}, "
-                          f"process_q={self.process_queue.qsize()}, "
-                          f"cache_size={cache_stats.get('size', 'N/A')}, "
-                          f"cache_hit_rate={cache_stats.get('hit_rate', 'N/A')}, "
-                          f"timeouts={self.stats.get('timeouts', 0)}")
+                    # Snapshot counters, then hand the stdout write to a thread
+                    processed = self.stats['processed']
+                    timeouts = self.stats.get('timeouts', 0)
+                    fetch_q = self.fetch_queue.qsize()
+                    process_q = self.process_queue.qsize()
+                    
+                    line = (f"\n📊 Status: processed={processed}, "
+                            f"memory={memory_mb}MB, "
+                            f"fetch_q={fetch_q}, "
+                            f"process_q={process_q}, "
+                            f"cache_size={cache_stats.get('size', 'N/A')}, "
+                            f"cache_hit_rate={cache_stats.get('hit_rate', 'N/A')}, "
+                            f"sim_cache={sim_stats['size']}/{sim_stats['max_size']} "
+                            f"(hits={sim_stats['hits']}, misses={sim_stats['misses']}), "
+                            f"timeouts={timeouts}")
+                    await asyncio.to_thread(print, line)
                 except asyncio.CancelledError:
                     break
-                except Exception:
-                    pass
+                except Exception as e:
+                    print(f"⚠️  Monitor error: {type(e).__name__}: {e}")
         
         monitor = asyncio.create_task(monitor_task())
         
@@ -875,34 +912,41 @@ class LastFmUserCrawler:
         pbar_fetch = tqdm(total=max_users, desc="📥 Fetching", position=1)
         pbar_process = tqdm(total=max_users, desc="⚙️ Processing", position=2)
         
-        # Create all workers
-        crawler_task = asyncio.create_task(self.worker_crawler(seed_user, max_users))
-        
-        fetcher_tasks = [
-            asyncio.create_task(self.worker_fetcher(pbar_fetch))
-            for _ in range(num_fetchers)
-        ]
-        processor_tasks = [
-            asyncio.create_task(self.worker_processor(pbar_process))
-            for _ in range(num_processors)
-        ]
-        
-        # Wait for crawler to finish discovery
-        await crawler_task
-        
-        # Wait for all queues to drain
-        await self.fetch_queue.join()
-        await self.process_queue.join()
-        
-        # Cancel monitor and workers
-        monitor.cancel()
-        for task in fetcher_tasks + processor_tasks:
-            task.cancel()
-        
-        pbar_crawl.update(self.stats["processed"])
-        pbar_crawl.close()
-        pbar_fetch.close()
-        pbar_process.close()
+        fetcher_tasks = []
+        processor_tasks = []
+        try:
+            # Create all workers
+            crawler_task = asyncio.create_task(self.worker_crawler(seed_user, max_users))
+            
+            fetcher_tasks = [
+                asyncio.create_task(self.worker_fetcher(pbar_fetch))
+                for _ in range(num_fetchers)
+            ]
+            processor_tasks = [
+                asyncio.create_task(self.worker_processor(pbar_process))
+                for _ in range(num_processors)
+            ]
+            
+            # Wait for crawler to finish discovery
+            await crawler_task
+            
+            # Wait for all queues to drain
+            await self.fetch_queue.join()
+            await self.process_queue.join()
+        finally:
+            # Also runs on errors/Ctrl-C so buffered NDJSON records are flushed
+            monitor.cancel()
+            for task in fetcher_tasks + processor_tasks:
+                task.cancel()
+            
+            pbar_crawl.update(self.stats["processed"])
+            pbar_crawl.close()
+            pbar_fetch.close()
+            pbar_process.close()
+            
+            if self.profiles_file is not None:
+                self.profiles_file.close()
+                self.profiles_file = None
         
         return self.stats["processed"], self.stats["failed"]
 
@@ -941,21 +985,19 @@ async def main():
         print(f"🎮 GPU available: {'✅ YES' if crawler.stats['gpu_available'] else '❌ NO'}")
         print()
         
+        # Profiles are streamed to disk while crawling
+        output_dir = Path(args.output)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        profiles_path = output_dir / "user_profiles.ndjson"
+        
         seeded, failed = await crawler.crawl_bfs_optimized(
             seed_user=args.seed_user,
             max_users=args.max_users,
             num_fetchers=args.fetchers,
-            num_processors=args.processors
+            num_processors=args.processors,
+            profiles_path=profiles_path
         )
         
-        # Save profiles
-        output_dir = Path(args.output)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        profiles_path = output_dir / "user_profiles.json"
-        with open(profiles_path, "w", encoding="utf-8") as f:
-            json.dump(crawler.user_profiles, f, indent=2, ensure_ascii=False)
-        
         final_ghosts = crawler.qdrant_service.count_users(is_real=False)
         
         # Print performance stats
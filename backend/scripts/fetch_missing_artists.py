@@ -2,33 +2,187 @@
 Fetch missing artists from Last.fm and prepare data for GNN retraining
 
 Optimized version with:
-- Concurrent requests with semaphore
+- Concurrent requests with an adaptive (AIMD) semaphore
 - Connection pooling
 - Batch processing
 - Retry logic with exponential backoff
 """
 
 import asyncio
+import csv
+import hashlib
 import httpx
 import json
-import pandas as pd
+import sqlite3
 from pathlib import Path
 from typing import List, Dict, Tuple
 import os
 from dotenv import load_dotenv
 from dataclasses import dataclass, field
 import time
+import random
+import sys
 
-load_dotenv()
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
-LASTFM_API_KEY = os.getenv("LASTFM_API_KEY")
 BASE_URL = "http://ws.audioscrobbler.com/2.0/"
 
 # Tuning parameters
 MAX_CONCURRENT_REQUESTS = 10  # Last.fm allows ~5 req/sec, we use 10 with delays
+MAX_ADAPTIVE_CONCURRENCY = 20  # Ceiling the adaptive limit may grow to
 REQUEST_TIMEOUT = 15.0
 MAX_RETRIES = 3
 RETRY_DELAY = 1.0
+RETRY_CAP = 30.0  # Upper bound for a single backoff sleep
+
+TRACK_FIELDS = ['track_name', 'artist_name', 'playcount', 'listeners']
+
+# Per-endpoint query templates (api_key/format are client-wide default params)
+ENDPOINT_PARAMS = (
+    ('tracks', (('method', 'artist.getTopTracks'), ('limit', '50'))),
+    ('tags', (('method', 'artist.getTopTags'), ('limit', '10'))),
+    ('similar', (('method', 'artist.getSimilar'), ('limit', '10'))),
+)
+
+# artist.getInfo returns tags and similar artists in one response (but only
+# ~5 of each), so this cuts requests from 3 to 2 per artist
+INFO_ENDPOINT_PARAMS = (
+    ENDPOINT_PARAMS[0],
+    ('info', (('method', 'artist.getInfo'),)),
+)
+
+RESULT_KINDS = ('tracks', 'tags', 'similar')
+
+Params = List[Tuple[str, str]]
+
+PROGRESS_EVERY = 10  # Redraw the progress line every N completed artists
+KEEPALIVE_EXPIRY = 30.0
+
+SIMILAR_BUDGET = 1500  # Max similar artists fetched on top of the seeds
+
+RESPONSE_CACHE_PATH = "data/lastfm_supplement/.httpcache.db"
+RESPONSE_CACHE_TTL = 7 * 24 * 3600  # Last.fm artist data changes slowly
+
+
+def _retry_after_seconds(response: httpx.Response) -> float:
+    """Parse a Retry-After header given in seconds (0 if absent or not numeric)"""
+    try:
+        return float(response.headers.get('Retry-After', 0))
+    except ValueError:
+        return 0.0
+
+
+def _decorrelated_jitter(previous: float) -> float:
+    """Next backoff sleep using decorrelated jitter (avoids synchronized retries)"""
+    return min(RETRY_CAP, random.uniform(RETRY_DELAY, previous * 3))
+
+
+class AdaptiveSemaphore:
+    """Concurrency limiter sized by AIMD on rate-limit feedback
+
+    The limit grows by one after every `increase_every` successful responses
+    (up to `max_limit`) and is multiplied by `factor` on a 429. Decreases are
+    spaced at least `cooldown` seconds apart so a burst of concurrent 429s
+    from one congestion event only shrinks the limit once.
+    """
+    def __init__(self, initial: int, max_limit: int, min_limit: int = 1,
+                 increase_every: int = 10, cooldown: float = RETRY_DELAY):
+        self.limit = initial
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.increase_every = increase_every
+        self.cooldown = cooldown
+        self._in_use = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_use < self.limit)
+            self._in_use += 1
+        return self
+
+    async def __aexit__(self, *args):
+        async with self._cond:
+            self._in_use -= 1
+            # Wake everyone: the limit may have grown since they started waiting
+            self._cond.notify_all()
+
+    def additive_increase(self):
+        """Record a successful response, raising the limit every N successes"""
+        self._successes += 1
+        if self._successes >= self.increase_every:
+            self._successes = 0
+            self.limit = min(self.max_limit, self.limit + 1)
+
+    def multiplicative_decrease(self, factor: float = 0.5):
+        """Shrink the limit after a rate-limit response"""
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._successes = 0
+        self.limit = max(self.min_limit, int(self.limit * factor))
+
+
+class ResponseCache:
+    """SQLite-backed cache of raw Last.fm responses (survives re-runs)
+
+    Entries are keyed by a hash of the request params and expire after `ttl`
+    seconds, so partially fetched artists cost no HTTP on the next run.
+    """
+    def __init__(self, db_path: str = RESPONSE_CACHE_PATH, ttl: int = RESPONSE_CACHE_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.hits = 0
+        Path(self.db_path).parent.mkdir(exist_ok=True, parents=True)
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def key(params: Params) -> str:
+        return hashlib.blake2b(repr(sorted(params)).encode(), digest_size=16).hexdigest()
+
+    def get(self, params: Params) -> bytes | None:
+        row = self._conn.execute(
+            "SELECT body FROM responses WHERE key = ? AND fetched_at > ?",
+            (self.key(params), time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, params: Params, body: bytes):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, body, fetched_at) VALUES (?, ?, ?)",
+            (self.key(params), body, time.time())
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def _loads(body: bytes) -> Dict:
+    return orjson.loads(body) if orjson is not None else json.loads(body)
 
 
 @dataclass
@@ -41,156 +195,287 @@ class FetchResult:
 
 
 class LastFmDataFetcher:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache: ResponseCache | None = None,
+                 use_info: bool = False):
         self.api_key = api_key
-        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.cache = cache
+        self.endpoints = INFO_ENDPOINT_PARAMS if use_info else ENDPOINT_PARAMS
+        self.semaphore = AdaptiveSemaphore(
+            MAX_CONCURRENT_REQUESTS, max_limit=MAX_ADAPTIVE_CONCURRENCY
+        )
         self._client: httpx.AsyncClient | None = None
+        # In-flight requests keyed by their query params so duplicates share one call
+        self._inflight: Dict[Tuple[Tuple[str, str], ...], asyncio.Future] = {}
 
     async def __aenter__(self):
+        # Keep every pooled connection alive between bursts; transport-level
+        # retries are disabled since _fetch_with_retry handles them
+        limits = httpx.Limits(
+            max_connections=MAX_ADAPTIVE_CONCURRENCY,
+            max_keepalive_connections=MAX_ADAPTIVE_CONCURRENCY,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
         self._client = httpx.AsyncClient(
+            params={'api_key': self.api_key, 'format': 'json'},
             timeout=REQUEST_TIMEOUT,
-            limits=httpx.Limits(max_connections=MAX_CONCURRENT_REQUESTS * 2),
-            http2=True  # Enable HTTP/2 for better performance
+            transport=httpx.AsyncHTTPTransport(
+                retries=0,
+                http2=True,  # Enable HTTP/2 for better performance
+                limits=limits
+            )
         )
+        await self._warmup()
         return self
 
     async def __aexit__(self, *args):
         if self._client:
             await self._client.aclose()
-
-    async def _request_with_retry(self, params: Dict) -> Dict | None:
-        """Make request with retry logic and rate limiting"""
-        async with self.semaphore:
-            for attempt in range(MAX_RETRIES):
-                try:
+        if self.cache:
+            self.cache.close()
+
+    async def _warmup(self):
+        """Establish the pooled connection before the concurrent burst starts"""
+        try:
+            await self._client.get(BASE_URL, params=[('method', 'tag.getTopTags')])
+        except httpx.HTTPError:
+            # Warmup is best-effort; real requests have their own retries
+            pass
+
+    async def _request_with_retry(self, params: Params) -> Dict | None:
+        """Make request, coalescing identical concurrent (method, artist) calls"""
+        if self.cache:
+            body = self.cache.get(params)
+            if body is not None:
+                return _loads(body)
+
+        # Artists are deduplicated before fetching, so this mostly guards
+        # overlapping similar-artist discovery. Waiters shield the shared
+        # future so cancelling one of them can't cancel it for everyone.
+        key = tuple(params)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._fetch_with_retry(params)
+            if not future.done():
+                future.set_result(result)
+            return result
+        finally:
+            if not future.done():
+                # Waiters see a failed request rather than the creator's exception
+                future.set_result(None)
+            del self._inflight[key]
+
+    async def _fetch_with_retry(self, params: Params) -> Dict | None:
+        """Make request with retry logic and rate limiting
+
+        The semaphore is held only while a request is in flight, so backoff
+        sleeps never occupy a concurrency slot. Backoff honours Retry-After
+        when the server sends it and uses decorrelated jitter otherwise.
+        """
+        sleep = RETRY_DELAY
+        for attempt in range(MAX_RETRIES):
+            try:
+                async with self.semaphore:
                     response = await self._client.get(BASE_URL, params=params)
-                    
-                    if response.status_code == 429:  # Rate limited
-                        wait_time = RETRY_DELAY * (2 ** attempt)
-                        await asyncio.sleep(wait_time)
-                        continue
-                    
-                    if response.status_code != 200 or not response.text:
-                        return None
-                    
-                    data = response.json()
-                    if 'error' in data:
-                        return None
-                    
-                    return data
-                    
-                except (httpx.TimeoutException, httpx.HTTPError):
-                    if attempt < MAX_RETRIES - 1:
-                        await asyncio.sleep(RETRY_DELAY * (2 ** attempt))
-                    continue
-            
-            return None
+            except (httpx.TimeoutException, httpx.HTTPError):
+                if attempt < MAX_RETRIES - 1:
+                    sleep = _decorrelated_jitter(sleep)
+                    await asyncio.sleep(sleep)
+                continue
 
-    async def get_artist_top_tracks(self, artist: str, limit: int = 50) -> List[Dict]:
-        """Fetch top tracks for an artist"""
-        params = {
-            'method': 'artist.getTopTracks',
-            'artist': artist,
-            'api_key': self.api_key,
-            'limit': limit,
-            'format': 'json'
-        }
-        
-        data = await self._request_with_retry(params)
-        if not data:
-            return []
-        
+            if response.status_code == 429:  # Rate limited
+                self.semaphore.multiplicative_decrease()
+                retry_after = _retry_after_seconds(response)
+                if attempt < MAX_RETRIES - 1:
+                    sleep = retry_after if retry_after > 0 else _decorrelated_jitter(sleep)
+                    await asyncio.sleep(sleep)
+                continue
+
+            if response.status_code != 200 or not response.content:
+                return None
+
+            self.semaphore.additive_increase()
+
+            data = _loads(response.content)
+            if 'error' in data:
+                return None
+
+            if self.cache:
+                self.cache.set(params, response.content)
+            return data
+
+        return None
+
+    def _build_params(self, artist: str) -> List[Tuple[str, Params]]:
+        """Request params for every endpoint fetched per artist"""
+        return [(kind, [*template, ('artist', artist)]) for kind, template in self.endpoints]
+
+    @staticmethod
+    def _parse_top_tracks(artist: str, data: Dict) -> List[Dict]:
+        """Extract top tracks for an artist"""
         tracks = data.get('toptracks', {}).get('track', [])
-        return [
-            {
-                'track_name': track.get('name'),
-                'artist_name': artist,
-                'playcount': int(track.get('playcount', 0)),
-                'listeners': int(track.get('listeners', 0))
-            }
-            for track in tracks
-        ]
-
-    async def get_artist_tags(self, artist: str) -> List[str]:
-        """Fetch genre tags for an artist"""
-        params = {
-            'method': 'artist.getTopTags',
-            'artist': artist,
-            'api_key': self.api_key,
-            'limit': 10,
-            'format': 'json'
-        }
-        
-        data = await self._request_with_retry(params)
-        if not data:
-            return []
-        
+        # Last.fm always sends name/playcount/listeners, so index directly
+        # and only fall back for malformed entries
+        parsed = []
+        for track in tracks:
+            try:
+                parsed.append({
+                    'track_name': track['name'],
+                    'artist_name': artist,
+                    'playcount': int(track['playcount']),
+                    'listeners': int(track['listeners'])
+                })
+            except (KeyError, ValueError):
+                parsed.append({
+                    'track_name': track.get('name'),
+                    'artist_name': artist,
+                    'playcount': int(track.get('playcount') or 0),
+                    'listeners': int(track.get('listeners') or 0)
+                })
+        return parsed
+
+    @staticmethod
+    def _parse_tags(artist: str, data: Dict) -> List[str]:
+        """Extract genre tags for an artist"""
         tags = data.get('toptags', {}).get('tag', [])
         return [tag.get('name', '').lower() for tag in tags if tag.get('name')]
 
-    async def get_similar_artists(self, artist: str, limit: int = 10) -> List[str]:
-        """Fetch similar artists"""
-        params = {
-            'method': 'artist.getSimilar',
-            'artist': artist,
-            'api_key': self.api_key,
-            'limit': limit,
-            'format': 'json'
+    @staticmethod
+    def _parse_similar(artist: str, data: Dict) -> List[str]:
+        """Extract similar artist names"""
+        similar = data.get('similarartists', {}).get('artist', [])
+        return [a.get('name') for a in similar if a.get('name')]
+
+    @staticmethod
+    def _parse_info(artist: str, data: Dict) -> Dict[str, List[str]]:
+        """Extract tags and similar artists from a single artist.getInfo response"""
+        info = data.get('artist', {})
+        tags = info.get('tags', {}).get('tag', [])
+        similar = info.get('similar', {}).get('artist', [])
+        return {
+            'tags': [tag.get('name', '').lower() for tag in tags if tag.get('name')],
+            'similar': [a.get('name') for a in similar if a.get('name')]
         }
-        
+
+    async def fetch_endpoint(self, artist: str, kind: str, params: Params) -> Dict[str, List]:
+        """Fetch and parse a single (artist, endpoint) request, keyed by result kind"""
         data = await self._request_with_retry(params)
         if not data:
-            return []
-        
-        similar = data.get('similarartists', {}).get('artist', [])
-        return [a.get('name') for a in similar if a.get('name')]
+            return _empty_results(kind)
+        if kind == 'info':
+            return self._parse_info(artist, data)
+        return {kind: _PARSERS[kind](artist, data)}
 
-    async def fetch_artist_complete(self, artist: str) -> Tuple[str, FetchResult]:
-        """Fetch all data for a single artist concurrently"""
-        # Run all 3 requests in parallel
-        tracks_task = self.get_artist_top_tracks(artist)
-        tags_task = self.get_artist_tags(artist)
-        similar_task = self.get_similar_artists(artist)
-        
-        tracks, tags, similar = await asyncio.gather(
-            tracks_task, tags_task, similar_task
-        )
-        
-        result = FetchResult(
-            tracks=tracks,
-            tags=tags,
-            similar=similar,
-            success=bool(tracks or tags)
-        )
-        
-        return artist, result
+
+def _empty_results(kind: str) -> Dict[str, List]:
+    """Placeholder results for a failed endpoint"""
+    return {'tags': [], 'similar': []} if kind == 'info' else {kind: []}
+
+
+_PARSERS = {
+    'tracks': LastFmDataFetcher._parse_top_tracks,
+    'tags': LastFmDataFetcher._parse_tags,
+    'similar': LastFmDataFetcher._parse_similar,
+}
 
 
 async def fetch_missing_artists_data(
     missing_artists: List[str], 
-    api_key: str,
+    fetcher: LastFmDataFetcher,
+    known_keys: frozenset = frozenset(),
+    similar_budget: int = 0,
     progress_callback=None
 ) -> Tuple[List[Dict], Dict]:
-    """Fetch data for all missing artists with concurrent processing"""
+    """Fetch data for all missing artists with concurrent processing
+
+    Similar artists of a seed artist are queued as soon as that seed is fetched
+    successfully (skipping anything in `known_keys` or already queued), up to
+    `similar_budget` extra artists, so discovery overlaps the primary fetches.
+    """
     
+    # Results are assembled per artist name, so names must be unique
+    missing_artists = list(dict.fromkeys(missing_artists))
     all_tracks = []
     artist_info = {}
     
-    print(f"\n📥 Fetching data for {len(missing_artists)} artists...")
-    print(f"   Using {MAX_CONCURRENT_REQUESTS} concurrent connections\n")
+    print(f"\n📥 Fetching data for {len(missing_artists)} artists "
+          f"(+ up to {similar_budget} similar)...")
+    print(f"   Using {fetcher.semaphore.limit} concurrent connections "
+          f"(adaptive, max {MAX_ADAPTIVE_CONCURRENCY})\n")
     
     start_time = time.time()
     
-    async with LastFmDataFetcher(api_key) as fetcher:
-        # Process all artists concurrently
-        tasks = [fetcher.fetch_artist_complete(artist) for artist in missing_artists]
-        
-        # Use as_completed for real-time progress
-        completed = 0
-        for coro in asyncio.as_completed(tasks):
-            artist, result = await coro
+    # Every (artist, endpoint) pair is its own job, so the semaphore admits
+    # any endpoint freely. The bounded input queue applies backpressure.
+    # Enough workers are started for the adaptive limit to reach its ceiling.
+    artist_queue = asyncio.Queue()
+    in_queue = asyncio.Queue(maxsize=MAX_ADAPTIVE_CONCURRENCY * 2)
+    out_queue = asyncio.Queue()
+
+    seeds = set(missing_artists)
+    seen = set(known_keys)
+    for artist in missing_artists:
+        seen.add(artist.casefold())
+        artist_queue.put_nowait(artist)
+
+    async def producer():
+        while True:
+            artist = await artist_queue.get()
+            if artist is None:
+                break
+            for kind, params in fetcher._build_params(artist):
+                await in_queue.put((artist, kind, params))
+        # One sentinel per worker to signal shutdown
+        for _ in range(MAX_ADAPTIVE_CONCURRENCY):
+            await in_queue.put(None)
+
+    async def worker():
+        while True:
+            job = await in_queue.get()
+            if job is None:
+                break
+            artist, kind, params = job
+            try:
+                results = await fetcher.fetch_endpoint(artist, kind, params)
+            except Exception:
+                results = _empty_results(kind)
+            await out_queue.put((artist, results))
+
+    # Consumer: assemble per-artist results as endpoints land
+    partial: Dict[str, Dict[str, List]] = {}
+    failed_artists = []
+    scheduled = len(missing_artists)
+    discovered = 0
+    completed = 0
+
+    # TaskGroup owns producer and workers: an unexpected worker error cancels
+    # the whole group instead of leaving the consumer waiting forever
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(producer())
+        for _ in range(MAX_ADAPTIVE_CONCURRENCY):
+            tg.create_task(worker())
+
+        while completed < scheduled:
+            artist, results = await out_queue.get()
+            parts = partial.setdefault(artist, {})
+            parts.update(results)
+
+            if len(parts) < len(RESULT_KINDS):
+                continue
+
+            del partial[artist]
             completed += 1
-            
+            result = FetchResult(
+                tracks=parts['tracks'],
+                tags=parts['tags'],
+                similar=parts['similar'],
+                success=bool(parts['tracks'] or parts['tags'])
+            )
+        
             if result.success:
                 all_tracks.extend(result.tracks)
                 artist_info[artist] = {
@@ -198,39 +483,99 @@ async def fetch_missing_artists_data(
                     'similar_artists': result.similar,
                     'track_count': len(result.tracks)
                 }
-                status = f"✅ {len(result.tracks)} tracks, {len(result.tags)} tags"
+
+                # Queue unseen similar artists of successful seeds (one level deep)
+                if artist in seeds:
+                    for similar in result.similar:
+                        if discovered >= similar_budget:
+                            break
+                        key = similar.casefold()
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        artist_queue.put_nowait(similar)
+                        scheduled += 1
+                        discovered += 1
             else:
-                status = "❌ Failed"
-            
-            # Progress bar
-            pct = (completed / len(missing_artists)) * 100
-            print(f"[{completed}/{len(missing_artists)}] {pct:5.1f}% | {artist[:30]:<30} | {status}")
-    
+                failed_artists.append(artist)
+        
+            # Throttled single-line progress bar
+            if completed % PROGRESS_EVERY == 0 or completed == scheduled:
+                pct = (completed / scheduled) * 100
+                sys.stdout.write(f"\r[{completed}/{scheduled}] {pct:5.1f}% | "
+                                 f"✅ {completed - len(failed_artists)} | ❌ {len(failed_artists)}")
+                sys.stdout.flush()
+
+        # Nothing left to discover: let the producer shut the workers down
+        artist_queue.put_nowait(None)
+        sys.stdout.write("\n")
+
+    if discovered:
+        print(f"🔗 Discovered {discovered} similar artists (budget {similar_budget})")
+
+    if failed_artists:
+        shown = ", ".join(failed_artists[:20])
+        more = f" (+{len(failed_artists) - 20} more)" if len(failed_artists) > 20 else ""
+        print(f"❌ Failed: {shown}{more}")
+
     elapsed = time.time() - start_time
-    rate = len(missing_artists) / elapsed if elapsed > 0 else 0
+    rate = completed / elapsed if elapsed > 0 else 0
     
     print(f"\n⏱️  Completed in {elapsed:.1f}s ({rate:.1f} artists/sec)")
     
     return all_tracks, artist_info
 
 
+def _write_json(path: str, data) -> None:
+    """Write compact JSON (machine-readable artifact, no pretty-printing)"""
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data))
+    else:
+        with open(path, "w", encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+def _latest_tracks_file(output_dir: str = "data/lastfm_supplement") -> Path | None:
+    """Most recently written tracks file (tracks.parquet or tracks.csv), if any"""
+    candidates = [
+        path for path in (Path(output_dir) / "tracks.parquet", Path(output_dir) / "tracks.csv")
+        if path.exists()
+    ]
+    return max(candidates, key=lambda p: p.stat().st_mtime) if candidates else None
+
+
 def save_supplement_data(
     tracks: List[Dict], 
     artist_info: Dict, 
-    output_dir: str = "data/lastfm_supplement"
+    output_dir: str = "data/lastfm_supplement",
+    tracks_format: str = "csv"
 ):
     """Save fetched data for later use"""
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-    # Save tracks as CSV
-    if tracks:
-        df_tracks = pd.DataFrame(tracks)
-        df_tracks.to_csv(f"{output_dir}/tracks.csv", index=False)
+    if tracks_format == "parquet" and pq is None:
+        print("⚠️  pyarrow not installed, saving tracks as CSV")
+        tracks_format = "csv"
+
+    if tracks and tracks_format == "parquet":
+        # Columnar + zstd; artist_name is dictionary-encoded
+        pq.write_table(
+            pa.Table.from_pylist(tracks),
+            f"{output_dir}/tracks.parquet",
+            compression='zstd'
+        )
+        print(f"\n💾 Saved {len(tracks)} tracks (parquet)")
+    elif tracks:
+        # Save tracks as CSV (streamed row by row, no DataFrame)
+        with open(f"{output_dir}/tracks.csv", "w", newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=TRACK_FIELDS)
+            writer.writeheader()
+            writer.writerows(tracks)
         print(f"\n💾 Saved {len(tracks)} tracks")
 
     # Save artist info as JSON
-    with open(f"{output_dir}/artist_info.json", "w", encoding='utf-8') as f:
-        json.dump(artist_info, f, indent=2, ensure_ascii=False)
+    _write_json(f"{output_dir}/artist_info.json", artist_info)
     print(f"💾 Saved {len(artist_info)} artists info")
 
     # Create summary
@@ -239,8 +584,7 @@ def save_supplement_data(
         'total_artists': len(artist_info),
         'artists': list(artist_info.keys())
     }
-    with open(f"{output_dir}/summary.json", "w", encoding='utf-8') as f:
-        json.dump(summary, f, indent=2, ensure_ascii=False)
+    _write_json(f"{output_dir}/summary.json", summary)
 
 
 def load_existing_data(output_dir: str = "data/lastfm_supplement") -> Tuple[List[Dict], Dict]:
@@ -249,20 +593,50 @@ def load_existing_data(output_dir: str = "data/lastfm_supplement") -> Tuple[List
     existing_info = {}
     
     info_path = Path(output_dir) / "artist_info.json"
-    tracks_path = Path(output_dir) / "tracks.csv"
+    tracks_path = _latest_tracks_file(output_dir)
     
     if info_path.exists():
-        with open(info_path, "r", encoding='utf-8') as f:
-            existing_info = json.load(f)
+        existing_info = _loads(info_path.read_bytes())
         print(f"📂 Loaded {len(existing_info)} existing artists")
     
-    if tracks_path.exists():
-        existing_tracks = pd.read_csv(tracks_path).to_dict('records')
+    if tracks_path is not None and tracks_path.suffix == ".parquet":
+        if pq is None:
+            # Saving without the existing tracks would drop them for good
+            print(f"❌ pyarrow not installed, cannot read {tracks_path}. Run: pip install pyarrow")
+            sys.exit(1)
+        existing_tracks = pq.read_table(tracks_path).to_pylist()
+        print(f"📂 Loaded {len(existing_tracks)} existing tracks")
+    elif tracks_path is not None:
+        with open(tracks_path, newline='', encoding='utf-8') as f:
+            existing_tracks = [
+                {
+                    'track_name': row['track_name'],
+                    'artist_name': row['artist_name'],
+                    'playcount': int(row['playcount'] or 0),
+                    'listeners': int(row['listeners'] or 0)
+                }
+                for row in csv.DictReader(f)
+            ]
         print(f"📂 Loaded {len(existing_tracks)} existing tracks")
     
     return existing_tracks, existing_info
 
 
+def _dedupe_casefold(names: List[str]) -> List[str]:
+    """Drop case-insensitive duplicates, keeping the first spelling and order"""
+    unique = {}
+    for name in names:
+        unique.setdefault(name.casefold(), name)
+    return list(unique.values())
+
+
+def load_fallback_artists(
+    path: Path = Path(__file__).with_name("data") / "fallback_artists.json"
+) -> List[str]:
+    """Load the hardcoded fallback artist list (only used without a tracker file)"""
+    return _loads(path.read_bytes())
+
+
 def load_missing_artists_from_tracker(
     tracker_path: str = "data/missing_artists.json",
     match_type: str = "all",
@@ -369,8 +743,38 @@ async def main():
         default=5,
         help="Minimum occurrences required (default: 5)"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk Last.fm response cache"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Tracks output format (parquet requires pyarrow; default: csv)"
+    )
+    parser.add_argument(
+        "--use-getinfo",
+        action="store_true",
+        help="Fetch tags and similar artists via one artist.getInfo call "
+             "(2 requests per artist instead of 3, but only ~5 of each)"
+    )
+    parser.add_argument(
+        "--similar-budget",
+        type=int,
+        default=SIMILAR_BUDGET,
+        help=f"Max similar artists to discover and fetch (default: {SIMILAR_BUDGET})"
+    )
     args = parser.parse_args()
 
+    # Read the environment here, not at import, so importing this module is side-effect free
+    load_dotenv()
+    api_key = os.getenv("LASTFM_API_KEY")
+    if not api_key:
+        print("❌ LASTFM_API_KEY not found in environment")
+        return
+
     print("=" * 60)
     print("🎵 Last.fm Missing Artists Data Fetcher (Optimized)")
     print("=" * 60)
@@ -379,7 +783,8 @@ async def main():
 
     # Load existing data
     existing_tracks, existing_info = load_existing_data()
-    existing_artists = set(existing_info.keys())
+    # Case-folded once so Last.fm casing variants are treated as the same artist
+    existing_keys = frozenset(a.casefold() for a in existing_info)
 
     # Try to load missing artists from tracker first
     tracked_missing = load_missing_artists_from_tracker(
@@ -387,80 +792,16 @@ async def main():
         min_occurrences=args.min_occurrences
     )
     
-    # If no tracked artists, use hardcoded list as fallback
+    # If no tracked artists, use the bundled list as fallback
     if not tracked_missing:
-        print("📝 Using hardcoded artist list as fallback\n")
-        missing_artists = [
-            "Kanye West", "The Beach Boys", "The Killers", "The Cure",
-            "My Chemical Romance", "Title Fight", "Joji", "Babasónicos",
-            "Little Jesus", "Daniel Caesar", "Mac DeMarco", "Faye Webster",
-            "Hotel Ugly", "Still Woozy", "The Marías", "José José",
-            "Post Malone", "A Flock of Seagulls", "Rojuu", "Def Leppard",
-            "Soda Stereo", "The Weeknd", "Radiohead", "Bandalos Chinos",
-            "Lana Del Rey", "Cuco", "Pusha T", "Lorde", "Charli xcx",
-            "NewJeans", "Weezer", "Enjambre", "Pescado Rabioso", "Zoé",
-            "Green Day", "John Mayer", "Billy Joel", "Mac Miller",
-            "AKRIILA", "Kings of Convenience", "No Doubt", "Twenty One Pilots",
-            "Chappell Roan", "Melody's Echo Chamber", "Tito Double P",
-            "Loona", "Depeche Mode", "The Doors", "Mazzy Star",
-            "Lou Reed", "Bob Dylan", "Fugazi", "Stevie Wonder", "Mon Laferte", 
-            "Papa Topo", "*NSYNC", "Earth, Wind & Fire", "Ichiko Aoba",
-            "Talking Heads", "Saint Motel", "Nujabes", "Maroon 5", "wave to earth",
-            "Gwinn", "BROCKHAMPTON", "Rage Against the Machine", "Bobby Pulido", 
-            "Los Fabulosos Cadillacs", "Bladee", "Pavement",
-            "Panchiko", "Matt Maltese", "Playboi Carti", "Sunlid", "The Smiths",
-            "Queen", "she's green", "Rod Stewart", "Red Hot Chili Peppers", "Fishmans",
-            "The Parcels", "ABBA", "Maria Daniela Y Su Sonido Lasser", 
-            "Surfistas del Sistema", "Cariño", "Jorge Drexler", "Daft Punk",
-            "Cupido", "Lewis OfMan", "Saja Boys", "Cro-Magnon", "Gorillaz",
-            "Laufey", "LJONES", "Yeat", "Foster the People", "Bruno Mars", "Chezile",
-            "Tan Bionica", "Cameron Winter", "MF DOOM", "The Notorious B.I.G.",
-            "HOME MADE 家族", "Baby Keem", "Rex Orange County", "BABYMETAL",
-            "DANGERDOOM", "Chavo", "Lil Yachty", "Joost", "Lin-Manuel Miranda",
-            "tarowo", "Leslie Odom Jr.", "Kali Uchis", "缺省", "U2", "Fleetwood Mac", "Duran Duran", "Alvvays", "ataquemos",
-            "Niños del Cerro", "Jalen Ngonda", "montegrande", "Patio Solar", "Toto",
-            "LSD and the Search for God", "Junior H", "Él mató a un policía motorizado",
-            "Michael Jackson", "Metronomy", "Paco Amoroso", "The Beatles", "Pink Floyd",
-            "Ca7riel & Paco Amoroso", "Deftones", "HUNTR/X", "Polo & Pan",
-            "Belle and Sebastian", "Joaquim Roberto Braga", "高中正義", "Slipknot",
-            "Chano", "wifiskeleton", "Las Ligas Menores", "Foo Fighters", "Madvillain",
-            "Jordan Ward", "Whirr", "Não Ao Futebol Moderno", "Natanael Cano", "Justice",
-            "RSP", "Sabino", "MINMI", "Korn", "Axolotes Mexicanos", "Kiddie Gang",
-            "Metric", "Björk", "Circus' End", "Sing-Sing", "cacomixtle", "f(x)",
-            "Duster", "Mannequin Pussy", "Princess Chelsea", "Angel Castillo Cas",
-            "Linda Perhacs", "A.R. Kane", "Dean Blunt", "Dave Bixby",
-            "Cleaners From Venus", "PASTEL GHOST", "Playa Gótica", "Astrid Sonne",
-            "Belanova", "America", "Oasis", "Hall & Oates", "asia menor", "Loathe", 
-            "David Bowie", "Javiera Mena", "Palacio Infantil", "Amantes Del Futuro",
-            "Silvana Estrada", "Mint Field", "Jimmy Eat World", "Pom Pom Squad", 
-            "mia.u", "Christopher Bear", "Foxtails", "The Microphones",
-            "Air Miami", "elaiyah", "diciembre de 2001", "centenario", "Nina Suárez",
-            "Aphex Twin", "Héctor Lavoe", "Deerhunter", "Estrella",
-            "Adobes Buenos", "Jasiel Núñez", "ALAMBRE DE PÚAS", "2003 Toyota Corolla",
-            "Alex G", "Secret Potion", "Crystal Castles", "Car Seat Headrest", 
-            "Enrique Bunbury", "Santa Sabina", "Swirlies", "tricot", "ミドリ", "La Lá", "Cap'n Jazz",
-            "Yves", "Bleary Eyed", "Lord Snow", "Autolux",
-            "Sleeping With Sirens", "Pearl Jam", "Death Grips", "Beach House",
-            "The Flaming Lips", "Slint", "Los Hermanos", "Nine Inch Nails",
-            "Sunny Day Real Estate", "Alexisonfire",
-            "Novo Amor", "Lost Frequencies", "Linkin Park", "Evanescence",
-            "Busted", "Whitney Houston", "George Michael", "Everything But the Girl",
-            "Boston",
-            "desert sand feels warm at night", "Arnold Schoenberg", "George Clanton",
-            "Park Young-goo", "Sonic Youth", "Hong Kong Express", "澄空時間",
-            "Bob Hocko", "Fornax Void",
-            "Los Estómagos", "C418", "3Pecados", "Frank Zappa", "Riki Musso",
-            "Travesía", "The Zombies", "Gentle Giant", "Claude Debussy",
-            "t e l e p a t h テレパシー能力者", "Lady Gaga", "Social Distortion",
-            "Calvin Harris", "Will Graefe", "Dua Lipa", "Porcupine Tree", "Suéter",
-            "Seatbelts", "Brave Little Abacus", "Kultivator", "Jonathan Geer",
-            "Roedelius", "川村ゆみ"
-        ]
+        print("📝 Using fallback artist list (scripts/data/fallback_artists.json)\n")
+        missing_artists = load_fallback_artists()
     else:
         missing_artists = tracked_missing
 
-    # Filter to only new artists
-    new_artists = [a for a in missing_artists if a not in existing_artists]
+    # Deduplicate (keeping priority order) and filter to only new artists
+    missing_artists = _dedupe_casefold(missing_artists)
+    new_artists = [a for a in missing_artists if a.casefold() not in existing_keys]
     
     if not new_artists:
         print("\n✅ All artists already fetched!")
@@ -469,32 +810,25 @@ async def main():
     print(f"\n📥 {len(new_artists)} new artists to fetch")
     print(f"⏭️  Skipping {len(missing_artists) - len(new_artists)} existing\n")
     
-    # Fetch new data
-    tracks, artist_info = await fetch_missing_artists_data(new_artists, LASTFM_API_KEY)
-    
-    # Merge with existing
-    existing_tracks.extend(tracks)
-    existing_info.update(artist_info)
-
-    # Optionally fetch similar artists
-    similar_to_fetch = set()
-    for info in artist_info.values():
-        for similar in info.get('similar_artists', [])[:50]: 
-            if similar not in existing_artists and similar not in artist_info:
-                similar_to_fetch.add(similar)
-    
-    if similar_to_fetch:
-        # Limit to first 1500 if too many
-        similar_list = list(similar_to_fetch)[:1500]
-        print(f"\n📥 Fetching {len(similar_list)} similar artists (from {len(similar_to_fetch)} total)...")
-        similar_tracks, similar_info = await fetch_missing_artists_data(
-            similar_list, LASTFM_API_KEY
+    cache = None if args.no_cache else ResponseCache()
+    async with LastFmDataFetcher(api_key, cache=cache,
+                                 use_info=args.use_getinfo) as fetcher:
+        # Fetch new artists; their similar artists are discovered in the same run
+        tracks, artist_info = await fetch_missing_artists_data(
+            new_artists, fetcher,
+            known_keys=existing_keys,
+            similar_budget=args.similar_budget
         )
-        existing_tracks.extend(similar_tracks)
-        existing_info.update(similar_info)
+        
+        # Merge with existing
+        existing_tracks.extend(tracks)
+        existing_info.update(artist_info)
+
+        if cache:
+            print(f"\n🗄️  Response cache hits: {cache.hits}")
 
     # Save all data
-    save_supplement_data(existing_tracks, existing_info)
+    save_supplement_data(existing_tracks, existing_info, tracks_format=args.format)
 
     print("\n" + "=" * 60)
     print("✅ Done!")
@@ -502,4 +836,10 @@ async def main():
 
 
 if __name__ == "__main__":
+    # uvloop has lower per-callback overhead than the default loop (optional)
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file
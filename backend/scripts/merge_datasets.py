@@ -3,10 +3,20 @@ Merge Last.fm supplement data with FMA format for GNN training
 Now includes genre assignment from tags
 """
 
+import numpy as np
 import pandas as pd
+import csv
 import json
+import re
 from pathlib import Path
 from collections import Counter
+from functools import lru_cache
+from importlib.util import find_spec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Noisy tags to filter out (artist names, metadata, locations, etc.)
 NOISY_TAG_PATTERNS = [
@@ -19,6 +29,16 @@ NOISY_TAG_PATTERNS = [
     'to listen', 'to buy', 'owned', 'wishlist'
 ]
 
+# All noisy patterns as one alternation so each tag is scanned once
+_NOISY_RE = re.compile('|'.join(map(re.escape, NOISY_TAG_PATTERNS)), re.IGNORECASE)
+
+# Artist-name normalization patterns
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+TRACK_COLUMNS = ['track_name', 'artist_name']  # Only columns the merge reads
+FORMATTED_FIELDS = ['track_id', 'track_name', 'artist_name', 'tags', 'genre_ids']
+
 # Direct tag to FMA genre_id mapping (based on FMA genres.csv)
 TAG_TO_GENRE_ID = {
     # Electronic (15)
@@ -96,11 +116,12 @@ TAG_TO_GENRE_ID = {
 
 def is_noisy_tag(tag: str) -> bool:
     """Check if a tag is noisy (should be filtered)"""
-    tag_lower = tag.lower()
-    for pattern in NOISY_TAG_PATTERNS:
-        if pattern in tag_lower:
-            return True
-    return False
+    return _NOISY_RE.search(tag) is not None
+
+
+def normalize_tags(tags: list) -> tuple:
+    """Lowercase/strip tags and drop noisy ones (done once per artist on load)"""
+    return tuple(tag.lower().strip() for tag in tags if not is_noisy_tag(tag))
 
 
 def tags_to_genre_ids(tags: list) -> list:
@@ -108,16 +129,16 @@ def tags_to_genre_ids(tags: list) -> list:
     if not tags:
         return []
     
-    genre_ids = set()
-    for tag in tags:
-        if is_noisy_tag(tag):
-            continue
-        
-        tag_lower = tag.lower().strip()
-        if tag_lower in TAG_TO_GENRE_ID:
-            genre_ids.add(TAG_TO_GENRE_ID[tag_lower])
-    
-    return list(genre_ids)
+    return list(_genre_ids_for_tags(normalize_tags(tags)))
+
+
+@lru_cache(maxsize=None)
+def _genre_ids_for_tags(tags: tuple) -> tuple:
+    """Memoized mapping of one normalized tag list (artists often share identical lists)"""
+    # One hash probe per tag; unknown tags contribute None, dropped afterwards
+    genre_ids = {TAG_TO_GENRE_ID.get(tag) for tag in tags}
+    genre_ids.discard(None)
+    return tuple(genre_ids)
 
 
 def merge_lastfm_to_augmented():
@@ -127,66 +148,89 @@ def merge_lastfm_to_augmented():
     augmented_dir = Path("data/augmented")
     augmented_dir.mkdir(parents=True, exist_ok=True)
     
-    # Load Last.fm tracks
-    tracks_path = supplement_dir / "tracks.csv"
-    if not tracks_path.exists():
+    # Load Last.fm tracks (whichever of parquet/CSV was written last)
+    candidates = [
+        path for path in (supplement_dir / "tracks.parquet", supplement_dir / "tracks.csv")
+        if path.exists()
+    ]
+    if not candidates:
         print("❌ No Last.fm tracks found")
         return
     
-    df = pd.read_csv(tracks_path)
+    tracks_path = max(candidates, key=lambda p: p.stat().st_mtime)
+    if tracks_path.suffix == ".parquet":
+        df = pd.read_parquet(tracks_path, columns=TRACK_COLUMNS)
+    else:
+        # pyarrow's multi-threaded CSV reader when installed, C engine otherwise
+        engine = 'pyarrow' if find_spec('pyarrow') is not None else 'c'
+        df = pd.read_csv(tracks_path, usecols=TRACK_COLUMNS, engine=engine)
     print(f"📥 Loaded {len(df)} Last.fm tracks")
     
     # Load artist info for tags
     artist_info_path = supplement_dir / "artist_info.json"
     artist_tags = {}
+    artist_genre_tags = {}  # Pre-normalized, noise-free tags for genre lookup
     if artist_info_path.exists():
-        with open(artist_info_path, "r", encoding='utf-8') as f:
-            artist_info = json.load(f)
-            for artist, info in artist_info.items():
-                artist_tags[artist.lower()] = info.get('tags', [])
-    
-    # Process tracks with genre assignment
-    formatted_tracks = []
-    genre_stats = Counter()
+        raw = artist_info_path.read_bytes()
+        artist_info = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        for artist, info in artist_info.items():
+            tags = info.get('tags', [])
+            artist_tags[artist.lower()] = tags
+            artist_genre_tags[artist.lower()] = normalize_tags(tags)
+    
+    # Process tracks with genre assignment (column-wise, one tag lookup per artist)
+    valid = df['artist_name'].notna()
+    skipped_null_artists = int((~valid).sum())
+    df = df[valid]
+    
+    # Artist names become categories: strip/lower and every tag lookup run once
+    # per unique name and are broadcast to the tracks through the category codes
+    artist_cat = df['artist_name'].astype(str).astype('category')
+    codes = artist_cat.cat.codes.to_numpy()
+    names = artist_cat.cat.categories.str.strip()
+    keys = names.str.lower()
+    
+    # Convert tags to genre IDs once per unique artist instead of once per track
+    cat_tags = [artist_tags.get(k, []) for k in keys]
+    # Tagless artists (a large share) skip the lookup call entirely
+    cat_genre_ids = [
+        list(_genre_ids_for_tags(tags)) if (tags := artist_genre_tags.get(k)) else []
+        for k in keys
+    ]
+    
+    # List columns are serialized as JSON once per artist (still readable by ast.literal_eval)
+    artists = names.to_numpy(dtype=object)[codes]
+    tags_json = np.array(
+        [json.dumps(t, ensure_ascii=False) for t in cat_tags], dtype=object
+    )[codes]
+    genre_ids_json = np.array([json.dumps(g) for g in cat_genre_ids], dtype=object)[codes]
+    
+    # Aggregate stats per artist weighted by track count, not per track
     tracks_with_genres = 0
-    skipped_null_artists = 0
-    
-    for idx, row in df.iterrows():
-        artist = row['artist_name']
-        
-        # Skip if artist is null/NaN
-        if pd.isna(artist):
-            skipped_null_artists += 1
-            continue
-        
-        artist = str(artist).strip()
-        tags = artist_tags.get(artist.lower(), [])
-        
-        # Convert tags to genre IDs
-        genre_ids = tags_to_genre_ids(tags)
-        
+    genre_stats = Counter()
+    for genre_ids, n_tracks in zip(cat_genre_ids, np.bincount(codes, minlength=len(keys))):
         if genre_ids:
-            tracks_with_genres += 1
+            tracks_with_genres += int(n_tracks)
             for gid in genre_ids:
-                genre_stats[gid] += 1
-        
-        formatted_tracks.append({
-            'track_id': f"lastfm_{idx}",
-            'track_name': row['track_name'],
-            'artist_name': artist,
-            'tags': str(tags),
-            'genre_ids': str(genre_ids) if genre_ids else '[]'
-        })
-    
-    # Save formatted tracks
-    output_df = pd.DataFrame(formatted_tracks)
-    output_path = augmented_dir / "lastfm_tracks_formatted.csv"
-    output_df.to_csv(output_path, index=False)
+                genre_stats[gid] += int(n_tracks)
     
-    print(f"\n✅ Saved {len(formatted_tracks)} tracks to {output_path}")
+    # Save formatted tracks (streamed straight from the columns, no DataFrame)
+    output_path = augmented_dir / "lastfm_tracks_formatted.csv"
+    with open(output_path, "w", newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(FORMATTED_FIELDS)
+        writer.writerows(zip(
+            'lastfm_' + df.index.astype(str),
+            df['track_name'].fillna(''),
+            artists,
+            tags_json,
+            genre_ids_json
+        ))
+    
+    print(f"\n✅ Saved {len(df)} tracks to {output_path}")
     if skipped_null_artists > 0:
         print(f"⚠️  Skipped {skipped_null_artists} tracks with null artist names")
-    print(f"📊 Tracks with genre assignments: {tracks_with_genres}/{len(formatted_tracks)} ({100*tracks_with_genres/len(formatted_tracks):.1f}%)")
+    print(f"📊 Tracks with genre assignments: {tracks_with_genres}/{len(df)} ({100*tracks_with_genres/len(df):.1f}%)")
     
     # Show genre distribution
     print(f"\n🎵 Top genres assigned:")
@@ -197,56 +241,48 @@ def merge_lastfm_to_augmented():
     build_artist_edges(artist_info, augmented_dir)
 
 
+@lru_cache(maxsize=200_000)
 def normalize_artist_name(name: str) -> str:
-    """Normalize artist name for matching"""
-    import re
+    """Normalize artist name for matching (memoized; similar lists repeat names)"""
     # Lowercase
     name = name.lower().strip()
     # Remove "the " prefix
-    if name.startswith('the '):
-        name = name[4:]
+    name = name.removeprefix('the ')
     # Remove special characters
-    name = re.sub(r'[^\w\s]', '', name)
+    name = _NON_WORD_RE.sub('', name)
     # Collapse whitespace
-    name = re.sub(r'\s+', ' ', name)
+    name = _WHITESPACE_RE.sub(' ', name)
     return name
 
 
 def build_artist_edges(artist_info: dict, output_dir: Path):
     """Build artist similarity graph with normalized matching"""
     
-    edges = []
-    all_artists = set()
+    all_artists = set(artist_info)
     
-    # Create normalized lookup
-    normalized_to_original = {}
-    for artist in artist_info.keys():
-        norm = normalize_artist_name(artist)
-        normalized_to_original[norm] = artist
-        all_artists.add(artist)
+    # Normalized lookup, built on the first exact-match miss (often never needed)
+    normalized_to_original = None
     
-    # Build edges from similar artists
+    # Build edges from similar artists, keyed by undirected pair so the first
+    # edge per pair is kept in order with a single hash table
+    edges_by_pair = {}
     for artist, info in artist_info.items():
-        similar = info.get('similar_artists', [])
-        for sim_artist in similar:
-            # Try exact match first
+        for sim_artist in info.get('similar_artists', ()):
+            # Try exact match first, then normalized match
             if sim_artist in all_artists:
-                edges.append({'source': artist, 'target': sim_artist})
+                target = sim_artist
             else:
-                # Try normalized match
-                sim_norm = normalize_artist_name(sim_artist)
-                if sim_norm in normalized_to_original:
-                    original = normalized_to_original[sim_norm]
-                    edges.append({'source': artist, 'target': original})
-    
-    # Remove duplicates
-    unique_edges = []
-    seen = set()
-    for edge in edges:
-        key = tuple(sorted([edge['source'], edge['target']]))
-        if key not in seen:
-            seen.add(key)
-            unique_edges.append(edge)
+                if normalized_to_original is None:
+                    normalized_to_original = {normalize_artist_name(a): a for a in artist_info}
+                target = normalized_to_original.get(normalize_artist_name(sim_artist))
+            if target is None:
+                continue
+            
+            key = (artist, target) if artist < target else (target, artist)
+            if key not in edges_by_pair:
+                edges_by_pair[key] = {'source': artist, 'target': target}
+    
+    unique_edges = list(edges_by_pair.values())
     
     # Save
     output = {
@@ -255,8 +291,11 @@ def build_artist_edges(artist_info: dict, output_dir: Path):
     }
     
     output_path = output_dir / "artist_graph_edges.json"
-    with open(output_path, "w", encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        output_path.write_bytes(orjson.dumps(output, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, "w", encoding='utf-8') as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
     
     print(f"\n🔗 Saved {len(unique_edges)} artist edges to {output_path}")
 
@@ -15,18 +15,22 @@ Usage:
 """
 
 import asyncio
+import bisect
 import aiohttp
 import json
 import os
 import sys
 import time
 import gc
+import hashlib
+import numpy as np
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Tuple
-from collections import defaultdict
+from typing import List, Dict, Iterator, NamedTuple, Optional, Tuple
+from collections import Counter, defaultdict
 from datetime import datetime
 from enum import Enum
+from itertools import islice
 
 # Add parent to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -34,11 +38,28 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from dotenv import load_dotenv
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+_json_dumps = orjson.dumps if orjson is not None else (lambda obj: json.dumps(obj).encode())
+
+try:
+    from aiolimiter import AsyncLimiter
+except ImportError:
+    AsyncLimiter = None
+
 load_dotenv()
 
 LASTFM_API_KEY = os.getenv("LASTFM_API_KEY")
 BASE_URL = "http://ws.audioscrobbler.com/2.0/"
 
+# Artist confidence cut-offs and the grade for each band (F below 0.2 ... A above 0.8)
+_GRADE_CUTS = (0.2, 0.4, 0.6, 0.8)
+_GRADES = ('F', 'D', 'C', 'B', 'A')
+
 
 class FetchResult(Enum):
     """Distinguish between different failure modes"""
@@ -49,6 +70,71 @@ class FetchResult(Enum):
     USER_NOT_FOUND = "user_not_found"  # User doesn't exist on Last.fm
 
 
+# Lightweight stand-ins for the pydantic schemas; the embedding service only
+# reads attributes, so validation per parsed row is wasted work here
+class ArtistEntry(NamedTuple):
+    name: str
+    playcount: int
+
+
+class TrackEntry(NamedTuple):
+    name: str
+    artist: str
+    playcount: int
+
+
+class RecentTrackEntry(NamedTuple):
+    name: str
+    artist: str
+    album: Optional[str]
+    timestamp: Optional[int]
+    nowplaying: bool
+
+
+class ArtistTallies:
+    """Per-artist match counts as parallel arrays (struct-of-arrays)
+
+    Names are interned once into a shared index; each match kind is an
+    int32 column, so top-K is an argpartition instead of a full sort.
+    """
+    KINDS = ('missing', 'fuzzy', 'zero_shot')
+    
+    def __init__(self, capacity: int = 1024):
+        self.names: List[str] = []
+        self.idx: Dict[str, int] = {}
+        self.counts = {kind: np.zeros(capacity, dtype=np.int32) for kind in self.KINDS}
+    
+    def _intern(self, name: str) -> int:
+        i = self.idx.get(name)
+        if i is None:
+            i = self.idx[name] = len(self.names)
+            self.names.append(name)
+            capacity = len(self.counts['missing'])
+            if i == capacity:
+                # Double every column together so indices stay aligned
+                for kind, column in self.counts.items():
+                    grown = np.zeros(capacity * 2, dtype=np.int32)
+                    grown[:capacity] = column
+                    self.counts[kind] = grown
+        return i
+    
+    def add(self, kind: str, names: List[str]):
+        """Count one occurrence of each name under the given match kind"""
+        if not names:
+            return
+        idxs = np.fromiter(map(self._intern, names), dtype=np.intp, count=len(names))
+        np.add.at(self.counts[kind], idxs, 1)
+    
+    def most_common(self, kind: str, k: int) -> List[Tuple[str, int]]:
+        """Top-k (name, count) pairs for a match kind, highest first"""
+        column = self.counts[kind][:len(self.names)]
+        candidates = np.flatnonzero(column)
+        if k < candidates.size:
+            candidates = candidates[np.argpartition(-column[candidates], k)[:k]]
+        top = candidates[np.argsort(-column[candidates], kind='stable')]
+        return [(self.names[i], int(column[i])) for i in top]
+
+
 @dataclass
 class MatchStats:
     """Track embedding match statistics across all users"""
@@ -62,10 +148,8 @@ class MatchStats:
     tracks_zero_shot: int = 0
     tracks_missing: int = 0
     
-    # Lists for detailed reporting
-    fuzzy_artists: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
-    missing_artists: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
-    zero_shot_artists: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # Per-artist tallies for detailed reporting
+    artist_tallies: ArtistTallies = field(default_factory=ArtistTallies)
     
     # User-level stats (more granular)
     users_processed: int = 0
@@ -81,24 +165,23 @@ class MatchStats:
     def add_user_stats(self, metadata: dict, username: str):
         """Add stats from a single user's embedding generation"""
         counts = metadata.get('counts', {})
+        get = counts.get
         
         # Aggregate counts
-        self.artists_exact += counts.get('artists_exact', 0)
-        self.artists_fuzzy += counts.get('artists_fuzzy', 0)
-        self.artists_zero_shot += counts.get('artists_zero_shot', 0)
-        self.artists_missing += counts.get('artists_missing', 0)
-        self.tracks_exact += counts.get('tracks_exact', 0)
-        self.tracks_fuzzy += counts.get('tracks_fuzzy', 0)
-        self.tracks_zero_shot += counts.get('tracks_zero_shot', 0)
-        self.tracks_missing += counts.get('tracks_missing', 0)
+        self.artists_exact += get('artists_exact', 0)
+        self.artists_fuzzy += get('artists_fuzzy', 0)
+        self.artists_zero_shot += get('artists_zero_shot', 0)
+        self.artists_missing += get('artists_missing', 0)
+        self.tracks_exact += get('tracks_exact', 0)
+        self.tracks_fuzzy += get('tracks_fuzzy', 0)
+        self.tracks_zero_shot += get('tracks_zero_shot', 0)
+        self.tracks_missing += get('tracks_missing', 0)
         
         # Track individual artists
-        for artist in metadata.get('artists_fuzzy', []):
-            self.fuzzy_artists[artist] += 1
-        for artist in metadata.get('artists_missing', []):
-            self.missing_artists[artist] += 1
-        for artist in metadata.get('artists_zero_shot', []):
-            self.zero_shot_artists[artist] += 1
+        tallies = self.artist_tallies
+        tallies.add('fuzzy', metadata.get('artists_fuzzy', ()))
+        tallies.add('missing', metadata.get('artists_missing', ()))
+        tallies.add('zero_shot', metadata.get('artists_zero_shot', ()))
         
         # Calculate quality grade for this user
         grade = self._calculate_grade(counts)
@@ -107,32 +190,20 @@ class MatchStats:
     
     def _calculate_grade(self, counts: dict) -> str:
         """Calculate quality grade based on match types"""
-        total_artists = sum([
-            counts.get('artists_exact', 0),
-            counts.get('artists_fuzzy', 0),
-            counts.get('artists_zero_shot', 0),
-            counts.get('artists_missing', 0)
-        ])
+        get = counts.get
+        exact = get('artists_exact', 0)
+        fuzzy = get('artists_fuzzy', 0)
+        zero_shot = get('artists_zero_shot', 0)
+        total_artists = exact + fuzzy + zero_shot + get('artists_missing', 0)
         
         if total_artists == 0:
             return 'F'
         
         # Weighted score: exact=1.0, fuzzy=0.5, zero_shot=0.3, missing=0
-        confidence = (
-            counts.get('artists_exact', 0) * 1.0 +
-            counts.get('artists_fuzzy', 0) * 0.5 +
-            counts.get('artists_zero_shot', 0) * 0.3
-        ) / total_artists
-        
-        if confidence > 0.8:
-            return 'A'
-        elif confidence > 0.6:
-            return 'B'
-        elif confidence > 0.4:
-            return 'C'
-        elif confidence > 0.2:
-            return 'D'
-        return 'F'
+        confidence = (exact + fuzzy * 0.5 + zero_shot * 0.3) / total_artists
+        
+        # bisect_left keeps the cut-offs exclusive (0.8 exactly is still a B)
+        return _GRADES[bisect.bisect_left(_GRADE_CUTS, confidence)]
     
     def print_summary(self):
         """Print comprehensive summary"""
@@ -192,28 +263,28 @@ class MatchStats:
                 print(f"  {grade_emojis[grade]} Grade {grade}: {bar} {count:4d} ({pct:5.1f}%)")
         
         # Top problematic artists
-        if self.missing_artists:
+        sorted_missing = self.artist_tallies.most_common('missing', 15)
+        if sorted_missing:
             print(f"\n❌ Top 15 Missing Artists (not in model):")
-            sorted_missing = sorted(self.missing_artists.items(), key=lambda x: x[1], reverse=True)[:15]
             for i, (artist, count) in enumerate(sorted_missing, 1):
                 print(f"  {i:2d}. {artist[:45]:<45} | {count:3d} users")
         
-        if self.fuzzy_artists:
+        sorted_fuzzy = self.artist_tallies.most_common('fuzzy', 15)
+        if sorted_fuzzy:
             print(f"\n⚠️  Top 15 Fuzzy-Matched Artists (potential mismatches):")
-            sorted_fuzzy = sorted(self.fuzzy_artists.items(), key=lambda x: x[1], reverse=True)[:15]
             for i, (artist, count) in enumerate(sorted_fuzzy, 1):
                 print(f"  {i:2d}. {artist[:45]:<45} | {count:3d} users")
         
-        if self.zero_shot_artists:
+        sorted_zs = self.artist_tallies.most_common('zero_shot', 15)
+        if sorted_zs:
             print(f"\n🔮 Top 15 Zero-Shot Artists (approximated embeddings):")
-            sorted_zs = sorted(self.zero_shot_artists.items(), key=lambda x: x[1], reverse=True)[:15]
             for i, (artist, count) in enumerate(sorted_zs, 1):
                 print(f"  {i:2d}. {artist[:45]:<45} | {count:3d} users")
         
         print("\n" + "=" * 70)
     
-    def save_report(self, output_path: str = "data/regeneration_report.json"):
-        """Save detailed report to JSON"""
+    async def save_report(self, output_path: str = "data/regeneration_report.json"):
+        """Save detailed report to JSON (serialized off the event loop)"""
         report = {
             "generated_at": datetime.utcnow().isoformat(),
             "summary": {
@@ -238,49 +309,123 @@ class MatchStats:
             },
             "quality_grades": dict(self.grades),
             "problematic_artists": {
-                "missing": dict(sorted(self.missing_artists.items(), key=lambda x: x[1], reverse=True)[:100]),
-                "fuzzy": dict(sorted(self.fuzzy_artists.items(), key=lambda x: x[1], reverse=True)[:100]),
-                "zero_shot": dict(sorted(self.zero_shot_artists.items(), key=lambda x: x[1], reverse=True)[:100]),
+                kind: dict(self.artist_tallies.most_common(kind, 100))
+                for kind in ArtistTallies.KINDS
             }
         }
         
+        await asyncio.to_thread(self._write_report, report, output_path)
+        print(f"\n💾 Detailed report saved to: {output_path}")
+    
+    @staticmethod
+    def _write_report(report: dict, output_path: str):
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            Path(output_path).write_bytes(
+                orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            )
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+class ResponseHeaderRateLimiter:
+    """Closed-loop pause driven by Last.fm's rate-limit feedback
+
+    A 429 (or Last.fm error 29), a Retry-After header, or an exhausted
+    X-RateLimit-Remaining pushes a shared resume time forward; every request
+    waits for it before going out, so one signal throttles all workers.
+    """
+    def __init__(self, default_backoff: float = 2.0, max_backoff: float = 60.0):
+        self.default_backoff = default_backoff
+        self.max_backoff = max_backoff
+        self._resume_at = 0.0
+        self._backoff = default_backoff
+    
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        while (delay := self._resume_at - loop.time()) > 0:
+            await asyncio.sleep(delay)
+    
+    def update(self, headers, rate_limited: bool = False) -> float:
+        """Record a response; returns the pause it imposed (0 if none)"""
+        delay = 0.0
+        try:
+            delay = float(headers.get("Retry-After", 0))
+            if not delay and int(headers.get("X-RateLimit-Remaining", 1)) <= 0:
+                delay = float(headers.get("X-RateLimit-Reset", self._backoff))
+        except ValueError:
+            pass
         
-        print(f"\n💾 Detailed report saved to: {output_path}")
+        if rate_limited and not delay:
+            # No hint from the server: back off exponentially until a success
+            delay = self._backoff
+            self._backoff = min(self.max_backoff, self._backoff * 2)
+        elif not rate_limited:
+            self._backoff = self.default_backoff
+        
+        if delay > 0:
+            # Capped: a reset header may be an epoch timestamp rather than seconds
+            delay = min(delay, self.max_backoff)
+            loop = asyncio.get_running_loop()
+            self._resume_at = max(self._resume_at, loop.time() + delay)
+        return delay
 
 
 class EmbeddingRegenerator:
     """Regenerate embeddings for existing users - FIXED VERSION"""
 
     # Rate limiting constants (Last.fm allows 5 req/s averaged over 5 min)
-    # Each user = 7 parallel requests, so ~1.5s between users keeps us safe
-    MAX_CONCURRENT_USERS = 1       # Sequential to avoid bursts
+    # A shared token bucket caps requests/s, so users can run concurrently
+    MAX_CONCURRENT_USERS = 16      # Worker tasks per batch (limiter sets the pace)
+    REQUESTS_PER_SECOND = 5
     MAX_RETRIES = 3
-    DELAY_BETWEEN_USERS = 0.8      # 7 reqs + 1s delay ≈ 4-5 req/s (safe margin)
     DELAY_BETWEEN_BATCHES = 5      # Short pause between batches
     DEFAULT_BATCH_SIZE = 100
+    CHECKPOINT_DIR = "data"        # regen_checkpoint_<model+filter key>.jsonl files live here
+    POSTFIX_EVERY = 50             # Users between progress-bar stats refreshes
     
-    def __init__(self, api_key: str, verbose: bool = False):
+    def __init__(self, api_key: str, verbose: bool = False, coalesce_periods: bool = False,
+                 resume: bool = False):
         self.api_key = api_key
+        self.resume = resume
+        self.coalesce_periods = coalesce_periods
         self.session = None
         self.embedding_service = None
         self.qdrant_service = None
         self.stats = MatchStats()
         self.verbose = verbose
         
-        # Semaphore for limiting concurrent users
-        self._user_semaphore = None
+        # Token bucket shared by every request (None if aiolimiter is missing)
+        self._limiter = None
+        # Pauses every request when Last.fm signals rate limiting
+        self._backpressure = ResponseHeaderRateLimiter()
+        
+        # Updated user points waiting for the next batched Qdrant upsert
+        self._pending_updates = []  # (embedding, point fields) awaiting upsert
+        self._checkpoint = None     # Append-only log of upserted user_ids (--resume runs only)
+        self._checkpoint_path: Optional[Path] = None
+        
+        # username -> profile fetch in progress, shared by concurrent lookups
+        self._inflight: Dict[str, asyncio.Task] = {}
         
     async def __aenter__(self):
-        # Create session with connection pooling
-        connector = aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+        # Create session with connection pooling; idle sockets are kept long
+        # enough to survive batch pauses so requests skip the TCP handshake
+        connector = aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=32,
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+            keepalive_timeout=75,
+            enable_cleanup_closed=True
+        )
         timeout = aiohttp.ClientTimeout(total=30, connect=10)
         self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
         
-        # Semaphore limits concurrent USERS, not requests
-        self._user_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_USERS)
+        # The limiter enforces the real constraint (requests/s), not user count
+        if AsyncLimiter:
+            self._limiter = AsyncLimiter(self.REQUESTS_PER_SECOND, 1)
         
         # Import services (suppress verbose output)
         import logging
@@ -292,26 +437,101 @@ class EmbeddingRegenerator:
         self.embedding_service = EmbeddingService()
         self.qdrant_service = qdrant_service
         
+        # The model and service objects live for the whole run: move them out
+        # of the collector's view and collect young objects less eagerly
+        # instead of forcing full collections between batches
+        gc.freeze()
+        gc.set_threshold(50_000, 50, 50)
+        
         return self
     
     async def __aexit__(self, *args):
         if self.session:
             await self.session.close()
+        self.flush_points()
+        if self._checkpoint:
+            self._checkpoint.close()
+    
+    def flush_points(self, wait: bool = True):
+        """Write all pending user points to Qdrant in one upsert"""
+        if not self._pending_updates:
+            return
+        pending, self._pending_updates = self._pending_updates, []
+        # One stacked float32 conversion per batch instead of a .tolist() per
+        # user; Qdrant stores float32 vectors anyway
+        vectors = np.stack([emb for emb, _ in pending]).astype(np.float32, copy=False).tolist()
+        points = [
+            self.qdrant_service.build_user_point(embedding=vector, **fields)
+            for vector, (_, fields) in zip(vectors, pending)
+        ]
+        try:
+            self.qdrant_service.upsert_user_points(points, wait=wait)
+        except Exception as e:
+            # A failed batch shouldn't abort the run; its users count as failed
+            print(f"  ❌ Upsert of {len(points)} users failed: {type(e).__name__}: {e}")
+            self.stats.users_processed -= len(points)
+            self.stats.users_embedding_failed += len(points)
+            return
+        
+        # Only users whose points reached Qdrant are marked as done
+        if self._checkpoint:
+            self._checkpoint.write(b"".join(
+                _json_dumps({"uid": fields["user_id"]}) + b"\n" for _, fields in pending
+            ))
+            self._checkpoint.flush()
+    
+    def checkpoint_path(self, filter_real: Optional[bool]) -> Path:
+        """Checkpoint file keyed to the model files and user filter of this run
+
+        A retrained model (or a different --real-only/--ghost-only filter)
+        gets a new file, so stale progress is never reused.
+        """
+        service = self.embedding_service
+        key = hashlib.blake2b(repr(filter_real).encode(), digest_size=8)
+        for model_file in (service.model_path, service.embeddings_path):
+            try:
+                stat = Path(model_file).stat()
+                key.update(f"{model_file}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+            except OSError:
+                key.update(str(model_file).encode())
+        return Path(self.CHECKPOINT_DIR) / f"regen_checkpoint_{key.hexdigest()}.jsonl"
+    
+    def load_checkpoint(self, path: Path) -> set:
+        """Read the user_ids upserted by a previous, interrupted run"""
+        if not path.exists():
+            return set()
+        done = set()
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    done.add(_json_loads(line)["uid"])
+                except (ValueError, KeyError):
+                    continue  # Partially written last line
+        return done
+    
+    def clear_checkpoint(self):
+        """Forget progress once a run has gone through every user"""
+        if self._checkpoint:
+            self._checkpoint.close()
+            self._checkpoint = None
+        if self._checkpoint_path:
+            self._checkpoint_path.unlink(missing_ok=True)
     
     async def _api_call(self, params: dict) -> Tuple[dict, FetchResult]:
         """
-        Single API call with retry logic. NO rate limiting here - 
-        rate limiting is done at the user level.
+        Single API call with retry logic, paced by the shared rate limiter.
         """
         for attempt in range(self.MAX_RETRIES):
             try:
+                await self._backpressure.wait()
+                if self._limiter:
+                    await self._limiter.acquire()
                 async with self.session.get(BASE_URL, params=params) as resp:
-                    # Rate limited
+                    # Rate limited: pause all workers, then retry
                     if resp.status == 429:
-                        wait_time = 2 ** attempt + 1
+                        wait_time = self._backpressure.update(resp.headers, rate_limited=True)
                         if self.verbose:
-                            print(f"  ⏳ Rate limited, waiting {wait_time}s...")
-                        await asyncio.sleep(wait_time)
+                            print(f"  ⏳ Rate limited, pausing {wait_time:.1f}s...")
                         continue
                     
                     # User not found
@@ -325,15 +545,20 @@ class EmbeddingRegenerator:
                             continue
                         return {}, FetchResult.API_ERROR
                     
-                    data = await resp.json()
+                    data = _json_loads(await resp.read())
                     
                     # Check for Last.fm error response
                     if "error" in data:
                         error_code = data.get("error")
                         if error_code == 6:  # User not found
                             return {}, FetchResult.USER_NOT_FOUND
+                        if error_code == 29:  # Rate limit exceeded
+                            self._backpressure.update(resp.headers, rate_limited=True)
+                            continue
                         return {}, FetchResult.API_ERROR
                     
+                    self._backpressure.update(resp.headers)
+                    
                     return data, FetchResult.SUCCESS
                     
             except asyncio.TimeoutError:
@@ -349,14 +574,29 @@ class EmbeddingRegenerator:
         return {}, FetchResult.RATE_LIMITED
     
     async def fetch_user_profile(self, username: str) -> Tuple[Optional[dict], FetchResult]:
+        """
+        Fetch a user profile, sharing one in-flight fetch between concurrent
+        lookups of the same username (ghost/real duplicates).
+        """
+        key = username.lower()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_user_profile(username))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so a cancelled caller doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
+    
+    async def _fetch_user_profile(self, username: str) -> Tuple[Optional[dict], FetchResult]:
         """
         Fetch complete user profile from Last.fm.
         All 7 requests go in PARALLEL (they're for the same user).
+        With coalesce_periods only 3 are sent (overall + recent tracks) and
+        the 6month/3month rankings are rebuilt from the recent-track timeline.
         Returns (profile_data, result_type) tuple.
         """
-        from app.models.schemas import Artist, Track, RecentTrack
-        
-        periods = ["overall", "6month", "3month"]
+        periods = ["overall"] if self.coalesce_periods else ["overall", "6month", "3month"]
+        n_periods = len(periods)
         
         # Create all tasks at once - parallel requests for this user
         tasks = []
@@ -389,19 +629,25 @@ class EmbeddingRegenerator:
             "user": username,
             "api_key": self.api_key,
             "format": "json",
-            "limit": 100
+            "limit": 200 if self.coalesce_periods else 100
         }))
         
-        # Execute ALL 7 requests in parallel
-        results = await asyncio.gather(*tasks)
-        
-        # Check if user exists (based on first response)
-        if results[0][1] == FetchResult.USER_NOT_FOUND:
-            return None, FetchResult.USER_NOT_FOUND
+        # Execute ALL 7 requests in parallel; a "user not found" from any of
+        # them cancels the rest so they don't spend rate-limiter tokens
+        tasks = [asyncio.create_task(t) for t in tasks]
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(t.result()[1] == FetchResult.USER_NOT_FOUND for t in done):
+                for t in pending:
+                    t.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                return None, FetchResult.USER_NOT_FOUND
+        results = [t.result() for t in tasks]
         
         # Check for rate limiting or API errors
         error_count = sum(1 for _, result in results if result != FetchResult.SUCCESS)
-        if error_count > 3:  # More than half failed
+        if error_count > len(results) // 2:  # More than half failed
             # Determine most common error
             if any(r[1] == FetchResult.RATE_LIMITED for r in results):
                 return None, FetchResult.RATE_LIMITED
@@ -414,7 +660,7 @@ class EmbeddingRegenerator:
                 return []
             artists = data.get("topartists", {}).get("artist", [])
             return [
-                Artist(name=a.get("name"), playcount=int(a.get("playcount", 0)))
+                ArtistEntry(name=a.get("name"), playcount=int(a.get("playcount", 0)))
                 for a in artists if a.get("name")
             ]
         
@@ -424,7 +670,7 @@ class EmbeddingRegenerator:
                 return []
             tracks = data.get("toptracks", {}).get("track", [])
             return [
-                Track(
+                TrackEntry(
                     name=t.get("name"),
                     artist=t.get("artist", {}).get("name", ""),
                     playcount=int(t.get("playcount", 0))
@@ -445,7 +691,7 @@ class EmbeddingRegenerator:
                 timestamp = None
                 if not nowplaying and t.get("date"):
                     timestamp = int(t["date"].get("uts", 0))
-                parsed.append(RecentTrack(
+                parsed.append(RecentTrackEntry(
                     name=t.get("name"),
                     artist=t.get("artist", {}).get("#text", ""),
                     album=t.get("album", {}).get("#text"),
@@ -455,18 +701,32 @@ class EmbeddingRegenerator:
             return parsed
         
         artists_by_period = {
-            "overall": parse_artists(results[0]),
-            "6month": parse_artists(results[1]),
-            "3month": parse_artists(results[2])
+            p: parse_artists(results[i]) for i, p in enumerate(periods)
         }
         
         tracks_by_period = {
-            "overall": parse_tracks(results[3]),
-            "6month": parse_tracks(results[4]),
-            "3month": parse_tracks(results[5])
+            p: parse_tracks(results[n_periods + i]) for i, p in enumerate(periods)
         }
         
-        recent_tracks = parse_recent(results[6])
+        recent_tracks = parse_recent(results[2 * n_periods])
+        
+        if self.coalesce_periods:
+            # Rank each window from scrobbles newer than its cutoff; windows
+            # the recent timeline doesn't reach fall back to overall
+            now = time.time()
+            for period, days in (("6month", 180), ("3month", 90)):
+                cutoff = now - days * 86400
+                window = [t for t in recent_tracks if t.nowplaying or (t.timestamp or 0) >= cutoff]
+                artist_counts = Counter(t.artist for t in window if t.artist)
+                track_counts = Counter((t.name, t.artist) for t in window)
+                artists_by_period[period] = [
+                    ArtistEntry(name=name, playcount=count)
+                    for name, count in artist_counts.most_common(50)
+                ] or artists_by_period["overall"]
+                tracks_by_period[period] = [
+                    TrackEntry(name=name, artist=artist, playcount=count)
+                    for (name, artist), count in track_counts.most_common(50)
+                ] or tracks_by_period["overall"]
         
         # Check if user has enough data
         if len(artists_by_period["overall"]) < 5:
@@ -480,9 +740,8 @@ class EmbeddingRegenerator:
             "artist_tags": {}
         }, FetchResult.SUCCESS
     
-    def get_all_users(self) -> List[dict]:
-        """Get all users from Qdrant"""
-        all_users = []
+    def iter_all_users(self, filter_real: Optional[bool] = None) -> Iterator[dict]:
+        """Yield users from Qdrant page by page (never holds the full list)"""
         offset = None
         
         while True:
@@ -497,86 +756,87 @@ class EmbeddingRegenerator:
             points, next_offset = result
             
             for point in points:
-                all_users.append({
+                is_real = point.payload.get("is_real", True)
+                if filter_real is not None and is_real != filter_real:
+                    continue
+                yield {
                     "user_id": str(point.id),
                     "username": point.payload.get("username"),
-                    "is_real": point.payload.get("is_real", True),
+                    "is_real": is_real,
                     "country": point.payload.get("country"),
                     "profile_image": point.payload.get("profile_image"),
-                    "top_genres": point.payload.get("top_genres", [])
-                })
+                    "top_genres": point.payload.get("top_genres", []),
+                    "created_at": point.payload.get("created_at")
+                }
             
             if next_offset is None:
                 break
             offset = next_offset
-        
-        return all_users
     
     async def regenerate_user(self, user: dict, dry_run: bool = False) -> bool:
-        """Regenerate embedding for a single user (with concurrency control)"""
+        """Regenerate embedding for a single user"""
         username = user["username"]
         
-        # Semaphore limits how many users are processed concurrently
-        async with self._user_semaphore:
-            try:
-                # Fetch fresh profile from Last.fm (7 parallel requests)
-                profile_data, fetch_result = await self.fetch_user_profile(username)
-                
-                # Handle different failure modes
-                if fetch_result == FetchResult.USER_NOT_FOUND:
-                    self.stats.users_not_found += 1
-                    return False
-                elif fetch_result == FetchResult.RATE_LIMITED:
-                    self.stats.users_rate_limited += 1
-                    return False
-                elif fetch_result == FetchResult.API_ERROR:
-                    self.stats.users_api_error += 1
-                    return False
-                elif fetch_result == FetchResult.NO_DATA:
-                    self.stats.users_no_data += 1
-                    return False
+        try:
+            # Fetch fresh profile from Last.fm (7 parallel requests)
+            profile_data, fetch_result = await self.fetch_user_profile(username)
+            
+            # Handle different failure modes
+            if fetch_result == FetchResult.USER_NOT_FOUND:
+                self.stats.users_not_found += 1
+                return False
+            elif fetch_result == FetchResult.RATE_LIMITED:
+                self.stats.users_rate_limited += 1
+                return False
+            elif fetch_result == FetchResult.API_ERROR:
+                self.stats.users_api_error += 1
+                return False
+            elif fetch_result == FetchResult.NO_DATA:
+                self.stats.users_no_data += 1
+                return False
+            
+            # Generate embedding with metadata (suppress timing output)
+            embedding, metadata = self.embedding_service.generate_user_embedding_temporal(
+                profile_data, return_metadata=True
+            )
+            
+            if embedding is None:
+                self.stats.users_embedding_failed += 1
+                return False
+            
+            # Track stats
+            self.stats.add_user_stats(metadata, username)
+            
+            if not dry_run:
+                # Get top artists for payload
+                top_artists = [a.name for a in profile_data["artists"]["overall"][:10]]
                 
-                # Generate embedding with metadata (suppress timing output)
-                embedding, metadata = self.embedding_service.generate_user_embedding_temporal(
-                    profile_data, return_metadata=True
+                # Infer genres
+                top_genres = self.embedding_service.infer_genres_from_tags(
+                    profile_data.get("artist_tags", {}),
+                    top_artists
                 )
                 
-                if embedding is None:
-                    self.stats.users_embedding_failed += 1
-                    return False
-                
-                # Track stats
-                self.stats.add_user_stats(metadata, username)
-                
-                if not dry_run:
-                    # Get top artists for payload
-                    top_artists = [a.name for a in profile_data["artists"]["overall"][:10]]
-                    
-                    # Infer genres
-                    top_genres = self.embedding_service.infer_genres_from_tags(
-                        profile_data.get("artist_tags", {}),
-                        top_artists
-                    )
-                    
-                    # Update in Qdrant
-                    self.qdrant_service.add_user_embedding(
-                        username=username,
-                        embedding=embedding.tolist(),
-                        top_artists=top_artists,
-                        is_real=user.get("is_real", True),
-                        country=user.get("country"),
-                        profile_image=user.get("profile_image"),
-                        top_genres=top_genres
-                    )
-                
-                return True
-                
-            except Exception as e:
-                if self.verbose:
-                    print(f"  ❌ {username}: {type(e).__name__}: {e}")
-                self.stats.users_embedding_failed += 1
-                return False
-    
+                # Queue the update; points are upserted to Qdrant once per batch
+                self._pending_updates.append((embedding, dict(
+                    user_id=user["user_id"],
+                    username=username,
+                    top_artists=top_artists,
+                    is_real=user.get("is_real", True),
+                    country=user.get("country"),
+                    profile_image=user.get("profile_image"),
+                    top_genres=top_genres,
+                    created_at=user.get("created_at")
+                )))
+            
+            return True
+            
+        except Exception as e:
+            if self.verbose:
+                print(f"  ❌ {username}: {type(e).__name__}: {e}")
+            self.stats.users_embedding_failed += 1
+            return False
+
     async def regenerate_all(
         self,
         batch_size: int = 50,
@@ -600,8 +860,10 @@ class EmbeddingRegenerator:
                 "user_id": user.get("user_id"),
                 "is_real": user.get("is_real", True),
                 "country": user.get("country"),
-                "profile_image": user.get("profile_image")
+                "profile_image": user.get("profile_image"),
+                "created_at": user.get("created_at")
             }, dry_run=dry_run)
+            self.flush_points()
             
             if success:
                 print(f"✅ Successfully regenerated embedding for {single_user}")
@@ -609,26 +871,41 @@ class EmbeddingRegenerator:
             self.stats.print_summary()
             return
         
-        # Get all users
-        print("📥 Fetching users from Qdrant...")
-        all_users = self.get_all_users()
-        
-        # Filter if needed
-        if filter_real is not None:
-            all_users = [u for u in all_users if u.get("is_real") == filter_real]
-        
-        total_users = len(all_users)
+        # Users are streamed from Qdrant one batch ahead of processing
+        users = self.iter_all_users(filter_real)
+        total_users = self.qdrant_service.count_users(is_real=filter_real)
         print(f"📊 Found {total_users} users to process")
         
+        # With --resume, skip users already upserted by an interrupted run of
+        # the same model and filter (never for dry runs or single users)
+        done = set()
+        if self.resume and not dry_run:
+            self._checkpoint_path = self.checkpoint_path(filter_real)
+            done = self.load_checkpoint(self._checkpoint_path)
+            self._checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+            self._checkpoint = open(self._checkpoint_path, "ab")
+        if done:
+            print(f"♻️  Resuming: skipping {len(done)} users from {self._checkpoint_path}")
+            users = (u for u in users if u["user_id"] not in done)
+        
         if dry_run:
             print("🔍 DRY RUN MODE - No changes will be saved")
         
-        print(f"⚡ Rate limiting: {self.DELAY_BETWEEN_USERS}s between users, {self.DELAY_BETWEEN_BATCHES}s between batches")
+        if self._limiter:
+            num_workers = self.MAX_CONCURRENT_USERS
+            print(f"⚡ Rate limiting: {self.REQUESTS_PER_SECOND} req/s shared by {num_workers} workers, {self.DELAY_BETWEEN_BATCHES}s between batches")
+        else:
+            num_workers = 1
+            print(f"⚡ Rate limiting: server feedback only, {self.DELAY_BETWEEN_BATCHES}s between batches (install aiolimiter for concurrency)")
         print(f"📦 Batch size: {batch_size} users")
         print()
         
         # Progress tracking
-        pbar = tqdm(total=total_users, desc="Regenerating")
+        # Redraws are throttled; the stats postfix is refreshed every few users
+        pbar = tqdm(
+            total=total_users, initial=min(len(done), total_users), desc="Regenerating",
+            mininterval=0.5, maxinterval=2.0
+        )
         completed = 0
         
         async def process_and_update(user):
@@ -636,17 +913,26 @@ class EmbeddingRegenerator:
             result = await self.regenerate_user(user, dry_run=dry_run)
             completed += 1
             pbar.update(1)
-            pbar.set_postfix({
-                'ok': self.stats.users_processed,
-                'err': self.stats.users_api_error,
-                'nodata': self.stats.users_no_data
-            })
+            if completed % self.POSTFIX_EVERY == 0:
+                pbar.set_postfix({
+                    'ok': self.stats.users_processed,
+                    'err': self.stats.users_api_error,
+                    'nodata': self.stats.users_no_data
+                }, refresh=False)
             return result
         
+        def next_batch():
+            # Scroll calls are blocking, so each batch is read in a thread
+            # while the previous one is being processed
+            return asyncio.create_task(asyncio.to_thread(lambda: list(islice(users, batch_size))))
+        
         # Process in batches with delays to avoid rate limiting
-        for batch_num, i in enumerate(range(0, total_users, batch_size)):
-            batch = all_users[i:i + batch_size]
-            batch_end = min(i + batch_size, total_users)
+        batch_num = 0
+        batch_end = 0
+        pending_batch = next_batch()
+        while batch := await pending_batch:
+            pending_batch = next_batch()
+            batch_end += len(batch)
 
             if batch_num > 0:
                 # Pause between batches to let rate limits reset
@@ -654,22 +940,36 @@ class EmbeddingRegenerator:
                 await asyncio.sleep(self.DELAY_BETWEEN_BATCHES)
                 pbar.set_description("Regenerating")
 
-            # Process users sequentially with delay between each
+            # Workers pull users from a queue; the limiter paces their requests
+            queue = asyncio.Queue()
             for user in batch:
-                await process_and_update(user)
-                await asyncio.sleep(self.DELAY_BETWEEN_USERS)
+                queue.put_nowait(user)
+
+            async def worker():
+                while not queue.empty():
+                    await process_and_update(queue.get_nowait())
 
-            # Garbage collect between batches
-            gc.collect()
+            await asyncio.gather(*(worker() for _ in range(min(num_workers, len(batch)))))
+
+            # One upsert per batch; wait=False lets Qdrant index it while the
+            # next batch is fetched
+            self.flush_points(wait=False)
 
             # Show batch progress
-            print(f"\n📦 Batch {batch_num + 1} complete ({batch_end}/{total_users} users)")
+            if self.verbose:
+                pbar.write(f"📦 Batch {batch_num + 1} complete ({batch_end}/{total_users} users)")
+            batch_num += 1
         
         pbar.close()
         
+        # Every user was visited, so the next run starts from scratch
+        if self._checkpoint:
+            self.flush_points()
+            self.clear_checkpoint()
+        
         # Print and save summary
         self.stats.print_summary()
-        self.stats.save_report()
+        await self.stats.save_report()
 
 
 async def main():
@@ -682,6 +982,11 @@ async def main():
     parser.add_argument("--ghost-only", action="store_true", help="Only process ghost users")
     parser.add_argument("--username", type=str, help="Regenerate single user (test mode)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument("--coalesce-periods", action="store_true",
+                        help="3 requests/user: derive 6month/3month rankings from recent tracks (A/B test)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Checkpoint progress and skip users already done by an interrupted run "
+                             "of the same model and filter")
     args = parser.parse_args()
     
     if not LASTFM_API_KEY:
@@ -702,7 +1007,10 @@ async def main():
         filter_real = False
         print("📌 Filtering: Ghost users only")
     
-    async with EmbeddingRegenerator(LASTFM_API_KEY, verbose=args.verbose) as regenerator:
+    async with EmbeddingRegenerator(
+        LASTFM_API_KEY, verbose=args.verbose, coalesce_periods=args.coalesce_periods,
+        resume=args.resume
+    ) as regenerator:
         # Print current stats
         total = regenerator.qdrant_service.count_users()
         real = regenerator.qdrant_service.count_users(is_real=True)
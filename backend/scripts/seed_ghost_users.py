@@ -22,6 +22,14 @@ from app.services.qdrant_service import qdrant_service
 from dotenv import load_dotenv
 
 
+async def count_users_by_type(exact: bool = False):
+    """(real, ghost, total) user counts, requested concurrently"""
+    return await asyncio.gather(*(
+        asyncio.to_thread(qdrant_service.count_users, is_real=is_real, exact=exact)
+        for is_real in (True, False, None)
+    ))
+
+
 async def main():
     # Parse arguments
     parser = argparse.ArgumentParser(description="Seed ghost users into Qdrant")
@@ -36,6 +44,12 @@ async def main():
         action="store_true",
         help="Delete existing ghost users before seeding"
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=GhostUserSeeder.DEFAULT_BATCH_SIZE,
+        help=f"Users per Qdrant upsert (default: {GhostUserSeeder.DEFAULT_BATCH_SIZE})"
+    )
     args = parser.parse_args()
 
     # Load environment variables
@@ -49,8 +63,7 @@ async def main():
     print()
 
     # Check current state
-    current_ghosts = qdrant_service.count_users(is_real=False)
-    current_real = qdrant_service.count_users(is_real=True)
+    current_real, current_ghosts, _ = await count_users_by_type()
 
     print(f"Current state:")
     print(f"  Real users: {current_real}")
@@ -69,7 +82,7 @@ async def main():
     print()
 
     seeder = GhostUserSeeder()
-    users_created = await seeder.seed_ghost_users(count=args.count)
+    users_created = await seeder.seed_ghost_users(count=args.count, batch_size=args.batch_size)
 
     print()
     print("=" * 60)
@@ -77,10 +90,8 @@ async def main():
     print("=" * 60)
     print(f"Users created: {users_created}")
 
-    # Final state
-    final_ghosts = qdrant_service.count_users(is_real=False)
-    final_real = qdrant_service.count_users(is_real=True)
-    final_total = qdrant_service.count_users()
+    # Final state (exact, since it's the reported result)
+    final_real, final_ghosts, final_total = await count_users_by_type(exact=True)
 
     print()
     print(f"Final state:")
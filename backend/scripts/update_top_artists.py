@@ -9,6 +9,9 @@ Much faster than regenerate_embeddings.py because:
 - No embedding computation
 - Direct payload update in Qdrant
 
+Set QDRANT_PREFER_GRPC=true (and QDRANT_GRPC_PORT, default 6334) to run the
+scroll and payload updates over gRPC; the gRPC port must be reachable.
+
 Usage:
     python scripts/update_top_artists.py --dry-run
     python scripts/update_top_artists.py
@@ -17,17 +20,34 @@ Usage:
 
 import asyncio
 import aiohttp
+import json
 import os
 import sys
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import AsyncIterator, List, Dict, NamedTuple, Optional, Tuple
 from dataclasses import dataclass
+from datetime import datetime, timezone
 
 # Add parent to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from dotenv import load_dotenv
 from tqdm import tqdm
+from qdrant_client.models import (
+    FieldCondition, Filter, MatchValue, PayloadSchemaType, SetPayload, SetPayloadOperation
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+try:
+    from aiolimiter import AsyncLimiter
+except ImportError:
+    AsyncLimiter = None
 
 load_dotenv()
 
@@ -36,8 +56,37 @@ BASE_URL = "http://ws.audioscrobbler.com/2.0/"
 
 # Rate limiting (Last.fm allows 5 req/s)
 MAX_CONCURRENT = 4          # Parallel requests
-DELAY_BETWEEN_BATCHES = 3   # Short pause between batches
-BATCH_SIZE = 50
+REQUESTS_PER_SECOND = 4.5   # Token bucket rate, slightly under the limit for clock skew
+MAX_ATTEMPTS = 4            # Tries per request on 429/5xx
+MAX_BACKOFF = 8             # Cap for exponential backoff (seconds)
+MAX_RETRY_AFTER = 60        # Cap for a server-provided Retry-After (seconds)
+SCROLL_PAGE_SIZE = 1000     # Points per Qdrant scroll page
+QUEUE_SIZE = 100            # Users buffered between the Qdrant scroll and the workers
+PROGRESS_EVERY = 50         # Users between progress bar updates
+MAX_OPS_PER_REQUEST = 200   # Payload updates folded into one Qdrant request
+WRITE_QUEUE_SIZE = 512      # Fetched updates buffered for the Qdrant writer
+WRITE_FLUSH_INTERVAL = 0.25 # Max seconds a partial write batch waits for more updates
+TOP_ARTISTS_VERSION = 2     # Payload marker for users already migrated to 30 artists
+NOT_FOUND_CACHE_PATH = "data/lastfm_not_found.json"  # Usernames Last.fm reported as missing
+
+
+def utc_now_iso() -> str:
+    """Timestamp for updated_at; second precision so a whole flush shares one value"""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+# Matches users whose payload predates the current top_artists migration
+PENDING_FILTER = Filter(must_not=[
+    FieldCondition(key="top_artists_v", match=MatchValue(value=TOP_ARTISTS_VERSION))
+])
+
+
+class UserRow(NamedTuple):
+    """The only user fields the update pass reads"""
+    user_id: str
+    username: str
+    current_count: int
+    top_artists: List[str]
 
 
 @dataclass
@@ -48,6 +97,9 @@ class UpdateStats:
     skipped_no_data: int = 0
     api_errors: int = 0
     not_found: int = 0
+    known_not_found: int = 0
+    unchanged: int = 0
+    retries: int = 0
 
     def print_summary(self):
         print("\n" + "=" * 50)
@@ -55,11 +107,14 @@ class UpdateStats:
         print("=" * 50)
         print(f"Total users processed: {self.total}")
         print(f"  Updated:      {self.updated}")
+        print(f"  Unchanged:    {self.unchanged}")
         print(f"  No data:      {self.skipped_no_data}")
         print(f"  API errors:   {self.api_errors}")
         print(f"  Not found:    {self.not_found}")
+        print(f"  Known 404s:   {self.known_not_found} (skipped)")
+        print(f"  Retries:      {self.retries}")
         if self.total > 0:
-            success_rate = self.updated / self.total * 100
+            success_rate = (self.updated + self.unchanged) / self.total * 100
             print(f"\nSuccess rate: {success_rate:.1f}%")
         print("=" * 50)
 
@@ -70,14 +125,32 @@ class TopArtistsUpdater:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.session = None
+        self.limiter = None
         self.qdrant_service = None
         self.stats = UpdateStats()
+        self.not_found_usernames: set = set()
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}  # Last.fm fetches in progress
+        # (user_id, artists) for the writer; artists=None only sets the version marker
+        self._write_queue: Optional[asyncio.Queue] = None
 
     async def __aenter__(self):
-        connector = aiohttp.TCPConnector(limit=50, ttl_dns_cache=300)
+        # Every request goes to Last.fm, so keep a small warm keep-alive pool
+        # sized to the concurrency instead of a large generic one
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONCURRENT * 2,
+            limit_per_host=MAX_CONCURRENT * 2,
+            ttl_dns_cache=600,
+            use_dns_cache=True,
+            keepalive_timeout=60,
+            enable_cleanup_closed=True
+        )
         timeout = aiohttp.ClientTimeout(total=15, connect=5)
         self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
 
+        # The token bucket paces requests smoothly instead of sleeping between batches
+        if AsyncLimiter:
+            self.limiter = AsyncLimiter(REQUESTS_PER_SECOND, 1)
+
         from app.services.qdrant_service import qdrant_service
         self.qdrant_service = qdrant_service
 
@@ -87,9 +160,20 @@ class TopArtistsUpdater:
         if self.session:
             await self.session.close()
 
-    async def fetch_top_artists(self, username: str, limit: int = 50) -> Tuple[Optional[List[str]], str]:
+    async def fetch_top_artists(self, username: str, limit: int = 30) -> Tuple[Optional[List[str]], str]:
+        """Fetch top artists, sharing one request between concurrent calls for the same user"""
+        key = (username.lower(), limit)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_top_artists(username, limit))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so a cancelled caller doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def _fetch_top_artists(self, username: str, limit: int) -> Tuple[Optional[List[str]], str]:
         """
-        Fetch top artists from Last.fm for a user.
+        Fetch top artists from Last.fm for a user (only the 30 we store are requested).
         Returns (artist_names, status) where status is 'success', 'not_found', 'no_data', or 'error'
         """
         params = {
@@ -101,128 +185,253 @@ class TopArtistsUpdater:
             "period": "overall"
         }
 
-        try:
-            async with self.session.get(BASE_URL, params=params) as resp:
-                if resp.status == 404:
-                    return None, "not_found"
-
-                if resp.status == 429:
-                    # Rate limited - wait and retry once
-                    await asyncio.sleep(2)
-                    async with self.session.get(BASE_URL, params=params) as retry_resp:
-                        if retry_resp.status != 200:
-                            return None, "error"
-                        data = await retry_resp.json()
-                elif resp.status != 200:
-                    return None, "error"
-                else:
-                    data = await resp.json()
+        data = None
+        delay = 0.0
+        network_retried = False
 
-                # Check for Last.fm error
-                if "error" in data:
-                    error_code = data.get("error")
-                    if error_code == 6:  # User not found
-                        return None, "not_found"
-                    return None, "error"
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt:
+                self.stats.retries += 1
+                await asyncio.sleep(delay)
+            if self.limiter:
+                await self.limiter.acquire()
 
-                # Parse artists
-                artists = data.get("topartists", {}).get("artist", [])
-                if not artists or len(artists) < 5:
-                    return None, "no_data"
+            try:
+                async with self.session.get(BASE_URL, params=params) as resp:
+                    if resp.status == 404:
+                        return None, "not_found"
 
-                artist_names = [a.get("name") for a in artists if a.get("name")]
-                return artist_names[:30], "success"  # Return top 30
+                    if resp.status == 429 or resp.status >= 500:
+                        # Back off 2s, 4s, 8s unless Last.fm says how long to wait
+                        delay = min(2 ** (attempt + 1), MAX_BACKOFF)
+                        retry_after = resp.headers.get("Retry-After")
+                        if retry_after:
+                            try:
+                                delay = min(float(retry_after), MAX_RETRY_AFTER)
+                            except ValueError:
+                                pass
+                        continue
+
+                    if resp.status != 200:
+                        return None, "error"
+                    data = _json_loads(await resp.read())
+                    break
+
+            except ValueError:
+                return None, "error"  # Malformed JSON body
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # Network hiccups get a single retry
+                if network_retried:
+                    return None, "error"
+                network_retried = True
+                delay = 2
+            except Exception:
+                return None, "error"
 
-        except asyncio.TimeoutError:
+        if data is None:
             return None, "error"
-        except Exception:
+
+        # Check for Last.fm error
+        if "error" in data:
+            error_code = data.get("error")
+            if error_code == 6:  # User not found
+                return None, "not_found"
             return None, "error"
 
-    def get_all_users(self) -> List[dict]:
-        """Get all users from Qdrant"""
-        all_users = []
-        offset = None
+        # Parse artists
+        artists = data.get("topartists", {}).get("artist", [])
+        if not artists or len(artists) < 5:
+            return None, "no_data"
 
-        while True:
-            result = self.qdrant_service.client.scroll(
+        artist_names = [name for a in artists if (name := a.get("name"))]
+        return artist_names[:limit], "success"
+
+    async def iter_user_pages(self) -> AsyncIterator[List[UserRow]]:
+        """Yield pages of not-yet-migrated users from Qdrant, prefetching the next page"""
+        def scroll(offset):
+            return self.qdrant_service.client.scroll(
                 collection_name=self.qdrant_service.collection_name,
-                limit=100,
+                scroll_filter=PENDING_FILTER,
+                limit=SCROLL_PAGE_SIZE,
                 offset=offset,
-                with_payload=True,
+                with_payload=["username", "top_artists"],
                 with_vectors=False
             )
 
-            points, next_offset = result
-
-            for point in points:
-                all_users.append({
-                    "user_id": str(point.id),
-                    "username": point.payload.get("username"),
-                    "current_artists_count": len(point.payload.get("top_artists", [])),
-                    "payload": point.payload
-                })
-
-            if next_offset is None:
-                break
-            offset = next_offset
+        page = asyncio.create_task(asyncio.to_thread(scroll, None))
 
-        return all_users
+        while page is not None:
+            points, next_offset = await page
+            page = None
+            if next_offset is not None:
+                page = asyncio.create_task(asyncio.to_thread(scroll, next_offset))
 
-    def update_user_payload(self, user_id: str, new_artists: List[str]):
+            rows = []
+            for point in points:
+                payload = point.payload or {}
+                username = payload.get("username")
+                if not username:
+                    continue  # Nothing to look up on Last.fm
+                top_artists = payload.get("top_artists") or []
+                rows.append(UserRow(
+                    str(point.id),
+                    username,
+                    len(top_artists),
+                    top_artists
+                ))
+            yield rows
+
+    async def update_user_payload(self, user_id: str, new_artists: List[str]):
         """Update only the top_artists field in Qdrant payload using set_payload (fast!)"""
-        from datetime import datetime
-
-        # Use set_payload - much faster than retrieve + upsert
-        self.qdrant_service.client.set_payload(
+        # Use set_payload - much faster than retrieve + upsert; the client is
+        # blocking, so it runs in a thread to keep the event loop free
+        await asyncio.to_thread(
+            self.qdrant_service.client.set_payload,
             collection_name=self.qdrant_service.collection_name,
             payload={
                 "top_artists": new_artists,
-                "updated_at": datetime.utcnow().isoformat()
+                "top_artists_v": TOP_ARTISTS_VERSION,
+                "updated_at": utc_now_iso()
             },
             points=[user_id]
         )
         return True
 
-    async def update_user(self, user: dict, dry_run: bool = False, semaphore: asyncio.Semaphore = None) -> bool:
+    async def flush_payloads(self, pending: List[Tuple[str, Optional[List[str]]]]):
+        """Send top_artists updates as batched set_payload operations"""
+        now = utc_now_iso()  # One timestamp per flush, not per user
+        marker_only = {"top_artists_v": TOP_ARTISTS_VERSION}
+
+        for i in range(0, len(pending), MAX_OPS_PER_REQUEST):
+            chunk = pending[i:i + MAX_OPS_PER_REQUEST]
+            ops = [
+                SetPayloadOperation(set_payload=SetPayload(
+                    payload=marker_only if artists is None else {
+                        "top_artists": artists,
+                        "top_artists_v": TOP_ARTISTS_VERSION,
+                        "updated_at": now
+                    },
+                    points=[user_id]
+                ))
+                for user_id, artists in chunk
+            ]
+            try:
+                await asyncio.to_thread(
+                    self.qdrant_service.client.batch_update_points,
+                    collection_name=self.qdrant_service.collection_name,
+                    update_operations=ops,
+                    wait=False
+                )
+            except Exception as e:
+                print(f"  Error updating {len(chunk)} users: {e}")
+                failed = sum(1 for _, artists in chunk if artists is not None)
+                self.stats.updated -= failed
+                self.stats.api_errors += failed
+
+    async def update_user(self, user: UserRow, dry_run: bool = False) -> bool:
         """Update a single user's top_artists"""
-        username = user["username"]
-
-        async with semaphore:
-            # Fetch fresh top artists from Last.fm
-            artists, status = await self.fetch_top_artists(username)
-
-            if status == "not_found":
-                self.stats.not_found += 1
-                return False
-            elif status == "no_data":
-                self.stats.skipped_no_data += 1
-                return False
-            elif status == "error":
-                self.stats.api_errors += 1
-                return False
-
-            # Success - update payload
+        # Fetch fresh top artists from Last.fm
+        artists, status = await self.fetch_top_artists(user.username)
+
+        if status == "not_found":
+            self.stats.not_found += 1
+            self.not_found_usernames.add(user.username)
+            return False
+        elif status == "no_data":
+            self.stats.skipped_no_data += 1
+            return False
+        elif status == "error":
+            self.stats.api_errors += 1
+            return False
+
+        # Same artists in the same (play rank) order - only mark it as migrated
+        if artists == user.top_artists:
+            self.stats.unchanged += 1
             if not dry_run:
-                try:
-                    self.update_user_payload(user["user_id"], artists)
-                except Exception as e:
-                    print(f"  Error updating {username}: {e}")
-                    self.stats.api_errors += 1
-                    return False
-
-            self.stats.updated += 1
+                await self._write_queue.put((user.user_id, None))
             return True
 
+        self.stats.updated += 1
+
+        # Success - queue the payload update for the next batched flush
+        if not dry_run:
+            await self._write_queue.put((user.user_id, artists))
+
+        return True
+
+    def has_payload_index(self, field_name: str) -> bool:
+        """Whether the collection has a payload index on the given field"""
+        info = self.qdrant_service.client.get_collection(self.qdrant_service.collection_name)
+        return field_name in (info.payload_schema or {})
+
+    def ensure_version_index(self):
+        """Index top_artists_v so the migrated-users filter is served by Qdrant"""
+        if not self.has_payload_index("top_artists_v"):
+            print("Creating 'top_artists_v' payload index...")
+            self.qdrant_service.client.create_payload_index(
+                collection_name=self.qdrant_service.collection_name,
+                field_name="top_artists_v",
+                field_schema=PayloadSchemaType.INTEGER
+            )
+
+    def count_pending_users(self) -> int:
+        """Count users not yet marked with the current top_artists version"""
+        return self.qdrant_service.client.count(
+            collection_name=self.qdrant_service.collection_name,
+            count_filter=PENDING_FILTER,
+            exact=False
+        ).count
+
+    def load_not_found(self):
+        """Load usernames that 404'd on earlier runs"""
+        path = Path(NOT_FOUND_CACHE_PATH)
+        if path.exists():
+            self.not_found_usernames = set(_json_loads(path.read_bytes()))
+
+    def save_not_found(self):
+        """Persist the known-missing usernames for the next run"""
+        path = Path(NOT_FOUND_CACHE_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(sorted(self.not_found_usernames)), encoding="utf-8")
+
+    async def write_payloads(self):
+        """Drain the write queue into Qdrant, a batch per MAX_OPS_PER_REQUEST or WRITE_FLUSH_INTERVAL"""
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            item = await self._write_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + WRITE_FLUSH_INTERVAL
+            while len(batch) < MAX_OPS_PER_REQUEST:
+                try:
+                    item = await asyncio.wait_for(self._write_queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            await self.flush_payloads(batch)
+
     async def update_all(
         self,
         dry_run: bool = False,
-        single_user: Optional[str] = None
+        single_user: Optional[str] = None,
+        retry_not_found: bool = False
     ):
         """Update top_artists for all users"""
 
         if single_user:
             print(f"\nTesting single user: {single_user}")
-            user = self.qdrant_service.get_user_by_username(single_user)
+            # The lookup is a filtered scroll; without a username index it scans the collection
+            if not await asyncio.to_thread(self.has_payload_index, "username"):
+                print("Creating missing 'username' payload index...")
+                await asyncio.to_thread(self.qdrant_service.ensure_indexes)
+            user = await asyncio.to_thread(
+                self.qdrant_service.get_user_by_username, single_user, with_vectors=False
+            )
             if not user:
                 print(f"User '{single_user}' not found in database")
                 return
@@ -237,59 +446,101 @@ class TopArtistsUpdater:
                     print(f"  ... and {len(artists) - 10} more")
 
             if not dry_run and artists:
-                self.update_user_payload(user["user_id"], artists)
+                await self.update_user_payload(user["user_id"], artists)
                 print(f"\nUpdated {single_user} with {len(artists)} artists")
             return
 
-        # Get all users
-        print("Fetching users from Qdrant...")
-        all_users = self.get_all_users()
-
-        # Filter users that already have 30 artists (optional optimization)
-        users_to_update = [u for u in all_users if u["current_artists_count"] < 30]
-        already_updated = len(all_users) - len(users_to_update)
+        # Users are streamed from Qdrant straight into the workers; already
+        # migrated users are filtered out server-side
+        await asyncio.to_thread(self.ensure_version_index)
+        total_users = await asyncio.to_thread(self.count_pending_users)
+        print(f"Users not yet migrated: {total_users}")
 
-        print(f"Total users: {len(all_users)}")
-        print(f"Already have 30 artists: {already_updated}")
-        print(f"Need update: {len(users_to_update)}")
+        if not retry_not_found:
+            self.load_not_found()
+            if self.not_found_usernames:
+                print(f"Skipping {len(self.not_found_usernames)} usernames Last.fm reported as not found")
 
         if dry_run:
             print("\nDRY RUN - No changes will be saved")
 
-        print(f"Concurrency: {MAX_CONCURRENT} parallel requests")
+        if self.limiter:
+            concurrency = MAX_CONCURRENT
+            print(f"Concurrency: {concurrency} parallel requests, {REQUESTS_PER_SECOND} req/s")
+        else:
+            concurrency = 1
+            print("Concurrency: 1 request at a time (install aiolimiter for parallel requests)")
         print()
 
-        self.stats.total = len(users_to_update)
-        semaphore = asyncio.Semaphore(MAX_CONCURRENT)
-
-        pbar = tqdm(total=len(users_to_update), desc="Updating")
+        # Redraws are also time-throttled; tick() already batches updates
+        pbar = tqdm(total=total_users, desc="Updating", mininterval=0.5)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        already_updated = 0
         completed = 0
 
-        async def process_user(user):
+        def tick():
+            # Redraw the bar (and its stats) once per PROGRESS_EVERY users
             nonlocal completed
-            result = await self.update_user(user, dry_run=dry_run, semaphore=semaphore)
             completed += 1
-            pbar.update(1)
-            pbar.set_postfix({
-                'ok': self.stats.updated,
-                'err': self.stats.api_errors,
-                'skip': self.stats.skipped_no_data
-            })
-            return result
-
-        for batch_num, i in enumerate(range(0, len(users_to_update), BATCH_SIZE)):
-            batch = users_to_update[i:i + BATCH_SIZE]
-
-            if batch_num > 0:
-                pbar.set_description(f"Pausing {DELAY_BETWEEN_BATCHES}s")
-                await asyncio.sleep(DELAY_BETWEEN_BATCHES)
-                pbar.set_description("Updating")
-
-            # Process batch in parallel (semaphore limits concurrency)
-            tasks = [process_user(user) for user in batch]
-            await asyncio.gather(*tasks)
+            if completed % PROGRESS_EVERY == 0:
+                pbar.set_postfix({
+                    'ok': self.stats.updated,
+                    'err': self.stats.api_errors,
+                    'skip': self.stats.skipped_no_data
+                }, refresh=False)
+                pbar.update(PROGRESS_EVERY)
+
+        async def producer():
+            nonlocal already_updated
+            async for page in self.iter_user_pages():
+                for user in page:
+                    # Users that already have 30 artists only need the version marker
+                    if user.current_count >= 30:
+                        already_updated += 1
+                        if not dry_run:
+                            await self._write_queue.put((user.user_id, None))
+                        tick()
+                        continue
+                    if user.username in self.not_found_usernames:
+                        self.stats.known_not_found += 1
+                        tick()
+                        continue
+                    self.stats.total += 1
+                    await queue.put(user)
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        async def worker():
+            # A fixed pool bounds requests in flight; the limiter paces them
+            while (user := await queue.get()) is not None:
+                try:
+                    await self.update_user(user, dry_run=dry_run)
+                except Exception as e:
+                    # One bad user must not take down the whole TaskGroup
+                    print(f"  Error updating {user.username}: {e}")
+                    self.stats.api_errors += 1
+                tick()
+
+        # Fetch workers hand results to a single writer, so a slow Qdrant write
+        # never holds a Last.fm slot
+        self._write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writer = asyncio.create_task(self.write_payloads())
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(producer())
+                for _ in range(concurrency):
+                    tg.create_task(worker())
+        finally:
+            # Whatever was fetched is still written, then the writer stops
+            await self._write_queue.put(None)
+            await writer
+            # Saved even if the run dies so the 404s found so far aren't re-queried
+            if not dry_run:
+                self.save_not_found()
 
+        pbar.update(completed % PROGRESS_EVERY)
         pbar.close()
+        print(f"Already had 30 artists: {already_updated}")
         self.stats.print_summary()
 
 
@@ -299,6 +550,8 @@ async def main():
     parser = argparse.ArgumentParser(description="Update top_artists payload (no embedding regen)")
     parser.add_argument("--dry-run", action="store_true", help="Don't save changes")
     parser.add_argument("--username", type=str, help="Update single user (test mode)")
+    parser.add_argument("--retry-not-found", action="store_true",
+                        help=f"Re-query usernames cached as not found in {NOT_FOUND_CACHE_PATH}")
     args = parser.parse_args()
 
     if not LASTFM_API_KEY:
@@ -317,7 +570,8 @@ async def main():
 
         await updater.update_all(
             dry_run=args.dry_run,
-            single_user=args.username
+            single_user=args.username,
+            retry_not_found=args.retry_not_found
         )
 
     return 0